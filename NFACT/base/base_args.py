@@ -88,6 +88,50 @@ def parallel_args(base_args: object, col: dict, help_message: str) -> None:
     )
 
 
+def cache_args(base_args: object, col: dict) -> None:
+    """
+    Function to add in matrix cache arguments to
+    arguments. Adds in argument group
+
+    Parameters
+    ----------
+    base_args: argparse.ArgumentParser
+        ArgumentParser to add group to
+    col: dict
+        dictionary of colour strings
+
+    Returns
+    -------
+    None
+    """
+    cache_options = base_args.add_argument_group(
+        f"{col['plum']}Matrix cache arguments{col['reset']}"
+    )
+    cache_options.add_argument(
+        "-cd",
+        "--cache_dir",
+        dest="cache_dir",
+        default=False,
+        help="""
+        Absolute path to a directory to cache converted
+        fdt_matrix2.dot files in. Each matrix is converted
+        once to a binary sparse matrix and re-used on
+        later runs until the .dot file changes.
+        """,
+    )
+    cache_options.add_argument(
+        "-cs",
+        "--cache_size",
+        dest="cache_size",
+        default=50,
+        help="""
+        Maximum size of the matrix cache in GB.
+        Least recently used matrices are deleted
+        once the cache is bigger than this. Default is 50
+        """,
+    )
+
+
 def set_up_args(base_args: object, col: dict) -> None:
     """
     Function to add in set up arguments to
@@ -1,9 +1,11 @@
 from NFACT.base.utils import colours, error_and_exit
 import os
+import shlex
 import subprocess
 import time
 from tqdm import tqdm
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 
 class Cluster_parameters:
@@ -158,6 +160,7 @@ def fsl_sub_cluster_command(
     queue: str = None,
     qos: str = None,
     gpu: bool = False,
+    task_file: str = None,
 ) -> list:
     """
     Function to build out fsl sub command.
@@ -178,6 +181,10 @@ def fsl_sub_cluster_command(
         SLURM qos. Can be None
     gpu: bool = False
         To use GPU.
+    task_file: str = None
+        file of commands, one per line,
+        to submit as an array job instead
+        of command_to_run.
 
     Returns
     -------
@@ -191,7 +198,10 @@ def fsl_sub_cluster_command(
         cluster_command.extend(["-q", str(queue)])
     if gpu:
         cluster_command.extend(["-c", "cuda"])
-    cluster_command.extend([" ".join(command_to_run)])
+    if task_file:
+        cluster_command.extend(["-t", str(task_file)])
+        return cluster_command
+    cluster_command.extend([shlex.join(command_to_run)])
     return cluster_command
 
 
@@ -200,18 +210,45 @@ class Queue_Monitoring:
     Class to Monitor cluster queue
     for jobs completion.
 
+    Jobs submitted with a sentinel file
+    are seen as finished as soon as the
+    file appears. All other outstanding
+    jobs are checked with fsl_sub_report
+    together, backing off from min_wait
+    to max_wait seconds while nothing
+    finishes.
+
     Usage
     ----
     queue = Queue_Monitoring()
-    queue.monitor(list_of_job_ids)
+    queue.monitor(list_of_job_ids, {job_id: sentinel_file})
+
+    Parameters
+    ----------
+    min_wait: float
+        shortest time between checks
+        in seconds. Default is 5
+    max_wait: float
+        longest time between fsl_sub_report
+        checks in seconds. Default is 120
+    report_command: str
+        path to fsl_sub_report or a stand in
+        with the same output. Default is the
+        NFACT_FSL_SUB_REPORT environment
+        variable, else $FSLDIR/bin/fsl_sub_report
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self, min_wait: float = 5, max_wait: float = 120, report_command: str = None
+    ) -> None:
         self.__spinner_running = True
         self.__col = colours()
+        self.__min_wait = min_wait
+        self.__max_wait = max_wait
+        self.__report_command = report_command
         print(f"{self.__col['pink']}\nStarting Queue Monitoring{self.__col['reset']}")
 
-    def monitor(self, job_id: list) -> None:
+    def monitor(self, job_id: list, sentinels: dict = None) -> None:
         """
         Main method to monitor queue.
 
@@ -219,12 +256,17 @@ class Queue_Monitoring:
         ----------
         job_id: list
             list of job_ids
+        sentinels: dict
+            dictionary of job id to the
+            sentinel file (or list of files
+            for array jobs) its job writes
+            on exit. Default is None
 
         Returns
         -------
         None
         """
-
+        sentinels = sentinels if sentinels else {}
         self.__spinner_running = True
         spinner_thread = threading.Thread(target=self.__spinner, daemon=True)
         spinner_thread.start()
@@ -233,21 +275,37 @@ class Queue_Monitoring:
             with tqdm(
                 total=len(job_id), desc="Jobs completed", unit="job", colour="magenta"
             ) as pbar:
-                completed_jobs = []
-                time.sleep(100)
-                while True:
-                    for job in job_id:
-                        if job not in completed_jobs:
-                            running = self.__check_job(job)
-                            if not running:
-                                pbar.update(1)
-                                completed_jobs.append(job)
-
-                    if len(completed_jobs) == len(job_id):
-                        pbar.close()
-                        print("All jobs have finihsed")
-                        break
-                    time.sleep(300)
+                outstanding = list(job_id)
+                report_wait = self.__min_wait
+                next_report = time.monotonic() + report_wait
+                while outstanding:
+                    time.sleep(
+                        self.__min_wait
+                        if sentinels
+                        else max(next_report - time.monotonic(), 0)
+                    )
+                    finished = [
+                        job
+                        for job in outstanding
+                        if job in sentinels and self.__sentinel_finished(sentinels[job])
+                    ]
+                    # Still query the scheduler for jobs killed before writing a sentinel
+                    if time.monotonic() >= next_report:
+                        reported = self.__check_jobs(
+                            [job for job in outstanding if job not in finished]
+                        )
+                        finished.extend(reported)
+                        report_wait = (
+                            self.__min_wait
+                            if reported
+                            else min(2 * report_wait, self.__max_wait)
+                        )
+                        next_report = time.monotonic() + report_wait
+                    for job in finished:
+                        outstanding.remove(job)
+                    pbar.update(len(finished))
+                pbar.close()
+                print("All jobs have finihsed")
 
         except KeyboardInterrupt:
             pbar.close()
@@ -280,6 +338,57 @@ class Queue_Monitoring:
             )
             time.sleep(0.1)
 
+    def __sentinel_finished(self, sentinel: str) -> bool:
+        """
+        Method to check if a job has
+        written its sentinel file(s).
+
+        Parameters
+        ----------
+        sentinel: str
+            path to sentinel file or
+            list of paths for array jobs
+
+        Returns
+        -------
+        bool: boolean
+            True if every sentinel
+            file has been written
+        """
+        sentinel = sentinel if isinstance(sentinel, list) else [sentinel]
+        exit_codes = [read_sentinel(sentinel_file) for sentinel_file in sentinel]
+        if None in exit_codes:
+            return False
+        for sentinel_file, exit_code in zip(sentinel, exit_codes):
+            if exit_code != "0":
+                tqdm.write(
+                    f"{self.__col['red']}JOB {os.path.basename(sentinel_file)} FAILED. CHECK LOGS{self.__col['reset']}"
+                )
+        return True
+
+    def __check_jobs(self, job_ids: list) -> list:
+        """
+        Method to check the progress
+        of outstanding jobs with one
+        concurrent batch of fsl_sub_report
+        calls.
+
+        Parameters
+        ----------
+        job_ids: list
+            list of job IDs
+
+        Returns
+        -------
+        list: list object
+            job IDs that have finished
+        """
+        if not job_ids:
+            return []
+        with ThreadPoolExecutor(min(len(job_ids), 16)) as executor:
+            running = list(executor.map(self.__check_job, job_ids))
+        return [job for job, is_running in zip(job_ids, running) if not is_running]
+
     def __check_job(self, job_id: str) -> bool:
         """
         Method to check job progress.
@@ -295,9 +404,7 @@ class Queue_Monitoring:
             True if job is still running
             or False if completed.
         """
-        output = run_fsl_sub(
-            [os.path.join(os.environ["FSLDIR"], "bin", "fsl_sub_report"), job_id]
-        )
+        output = run_fsl_sub([self.__report(), job_id])
         if "Finished" in output["stdout"]:
             return False
         if "Failed" in output["stdout"]:
@@ -307,6 +414,124 @@ class Queue_Monitoring:
             return False
         return True
 
+    def __report(self) -> str:
+        """
+        Method to get the fsl_sub_report
+        command.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        str: string
+            path to fsl_sub_report
+        """
+        if self.__report_command:
+            return self.__report_command
+        return os.environ.get(
+            "NFACT_FSL_SUB_REPORT",
+            os.path.join(os.environ.get("FSLDIR", ""), "bin", "fsl_sub_report"),
+        )
+
+
+def sentinel_path(log_directory: str, log_name: str) -> str:
+    """
+    Function to get the path of the
+    sentinel file a job writes its
+    exit code to.
+
+    Parameters
+    ----------
+    log_directory: str
+        Path to log directory
+    log_name: str
+        Name of log file
+
+    Returns
+    -------
+    str: string
+        path to sentinel file
+    """
+    return os.path.join(log_directory, f"{log_name}.exit")
+
+
+def sentinel_command(command: list, sentinel: str) -> list:
+    """
+    Function to add writing the exit code
+    to a sentinel file onto a command.
+    The command is quoted and ran with
+    sh -c so that it does not depend on
+    fsl_sub using a shell and paths can
+    have spaces in. Any stale sentinel
+    file is removed.
+
+    Parameters
+    ----------
+    command: list
+        command to run on cluster
+    sentinel: str
+        path to sentinel file
+
+    Returns
+    -------
+    list: list object
+        command that writes the
+        sentinel file on exit
+    """
+    if os.path.exists(sentinel):
+        os.remove(sentinel)
+    return [
+        "sh",
+        "-c",
+        f"{shlex.join(command)}; echo $? > {shlex.quote(sentinel)}",
+    ]
+
+
+def write_sentinel(sentinel: str, exit_code: int) -> None:
+    """
+    Function to write an exit code to
+    a sentinel file for jobs run locally.
+
+    Parameters
+    ----------
+    sentinel: str
+        path to sentinel file
+    exit_code: int
+        exit code of job
+
+    Returns
+    -------
+    None
+    """
+    with open(sentinel, "w") as sentinel_file:
+        sentinel_file.write(f"{exit_code}\n")
+
+
+def read_sentinel(sentinel: str) -> str:
+    """
+    Function to read the exit code
+    from a sentinel file.
+
+    Parameters
+    ----------
+    sentinel: str
+        path to sentinel file
+
+    Returns
+    -------
+    str: string
+        exit code or None if the
+        file is not written yet
+    """
+    try:
+        with open(sentinel) as sentinel_file:
+            exit_code = sentinel_file.read().strip()
+    except FileNotFoundError:
+        return None
+    return exit_code if exit_code else None
+
 
 def no_cluster_queues():
     """
@@ -373,6 +598,7 @@ def cluster_submission(
     log_location: str,
     cluster_qos: str,
     gpu: bool,
+    sentinel: str = None,
 ) -> str:
     """
     Function to submit jobs to cluster.
@@ -398,6 +624,9 @@ def cluster_submission(
         SLURM qos. Can be None
     gpu: bool = False
         To use GPU.
+    sentinel: str = None
+        path of a sentinel file for the
+        job to write its exit code to
 
     Returns
     -------
@@ -405,6 +634,8 @@ def cluster_submission(
         job id of cluster
         submission
     """
+    if sentinel:
+        command = sentinel_command(command, sentinel)
     bcluster_command = base_command(
         cluster_time,
         cluster_ram,
@@ -418,6 +649,76 @@ def cluster_submission(
     return fsl_sub_rout["stdout"]
 
 
+def cluster_array_submission(
+    commands: list,
+    task_file: str,
+    cluster_time: str,
+    cluster_ram: str,
+    cluster_queue: str,
+    log_name: str,
+    log_location: str,
+    cluster_qos: str,
+    gpu: bool,
+    sentinels: list = None,
+) -> str:
+    """
+    Function to submit a list of commands
+    to the cluster as one array job, with
+    one task per command.
+
+    Parameters
+    ----------
+    commands: list
+        list of commands to run on cluster
+    task_file: str
+        path to write the array task file to
+    cluster_time: str,
+        time each task will take
+    cluster_ram: str
+        amount of ram needed per task
+    cluster_queue: str = None
+        Queue to send command to.
+        Can be None as fsl sub
+        can assign queue.
+    log_name: str
+        name of process and lo file
+    log_location: str
+        location of where log should be
+        sent
+    cluster_qos: str = None
+        SLURM qos. Can be None
+    gpu: bool = False
+        To use GPU.
+    sentinels: list = None
+        paths of sentinel files, one
+        per command, for the tasks to
+        write their exit code to
+
+    Returns
+    -------
+    str: string
+        job id of array job
+    """
+    if sentinels:
+        commands = [
+            sentinel_command(command, sentinel)
+            for command, sentinel in zip(commands, sentinels)
+        ]
+    with open(task_file, "w") as tasks:
+        tasks.write("\n".join(shlex.join(command) for command in commands) + "\n")
+    bcluster_command = base_command(
+        cluster_time,
+        cluster_ram,
+        log_location,
+        log_name,
+    )
+    cluster_command = fsl_sub_cluster_command(
+        bcluster_command, [], cluster_queue, cluster_qos, gpu, task_file
+    )
+    fsl_sub_rout = run_fsl_sub(cluster_command)
+    return fsl_sub_rout["stdout"]
+
+
 def processing_cluster(arg: dict) -> dict:
     """
     Function to process cluster.
@@ -3,6 +3,7 @@ import os
 import nibabel as nb
 import numpy as np
 import re
+from functools import lru_cache
 from NFACT.base.utils import error_and_exit
 
 
@@ -46,16 +47,133 @@ def mat2vol(matrix: np.ndarray, lut_vol: np.ndarray) -> np.ndarray:
         array reformatted to be converted to
         a volume
     """
+    indices = lookup_indices(lut_vol)
+    return scatter_to_volume(
+        matrix[:, indices["columns"]].T, indices["voxels"], lut_vol.shape
+    )
+
+
+def lookup_indices(lut_vol: np.ndarray) -> dict:
+    """
+    Function to get the indices that
+    map matrix columns to voxels of a
+    lookup volume.
+
+    Parameters
+    ----------
+    lut_vol: ndarray
+        data from lookup volume
+
+    Returns
+    -------
+    dict: dictionary
+        dict of flat voxel indices (voxels)
+        and the matrix column of each of
+        those voxels (columns)
+    """
+    lut_vol = lut_vol.reshape(-1)
+    voxels = np.flatnonzero(lut_vol > 0)
+    return {"voxels": voxels, "columns": lut_vol[voxels] - 1}
+
+
+def lookup_volume(path_to_lookup_vol: str) -> dict:
+    """
+    Function to load a lookup volume
+    and its indices. Each lookup volume is only
+    read once unless the file changes.
+
+    Parameters
+    ----------
+    path_to_lookup_vol: str
+        path to look up volume from probtrackx
+
+    Returns
+    -------
+    dict: dictionary
+        dict of nibabel image (image),
+        voxels and columns
+    """
+    return cached_lookup_volume(
+        path_to_lookup_vol, os.stat(path_to_lookup_vol).st_mtime_ns
+    )
+
+
+@lru_cache(maxsize=8)
+def cached_lookup_volume(path_to_lookup_vol: str, modified_time: int) -> dict:
+    """
+    Function to read a lookup volume and
+    its indices. Cached on the path and
+    modification time.
 
-    mask = lut_vol > 0
-    n_components = matrix.shape[0]
-    matvol = np.zeros(lut_vol.shape + (n_components,))
+    Parameters
+    ----------
+    path_to_lookup_vol: str
+        path to look up volume from probtrackx
+    modified_time: int
+        modification time of the
+        lookup volume in ns
 
-    for row in range(n_components):
-        matvol.reshape(-1, n_components)[mask.flatten(), row] = matrix[
-            row, lut_vol[mask] - 1
-        ]
-    return matvol
+    Returns
+    -------
+    dict: dictionary
+        dict of nibabel image (image),
+        voxels and columns
+    """
+    lut_vol = nb.load(path_to_lookup_vol)
+    indices = lookup_indices(np.asarray(lut_vol.dataobj).astype(np.int32))
+    for index in indices.values():
+        index.setflags(write=False)
+    return {"image": lut_vol, **indices}
+
+
+def scatter_to_volume(
+    matrix: np.ndarray, voxels: np.ndarray, shape: tuple
+) -> np.ndarray:
+    """
+    Function to scatter the rows of a
+    matrix into voxels of a volume,
+    all components at once.
+
+    Parameters
+    ----------
+    matrix: np.ndarray
+        voxels by components matrix
+    voxels: np.ndarray
+        flat voxel index of each row
+    shape: tuple
+        shape of the volume
+
+    Returns
+    -------
+    volume: np.ndarray
+        float32 volume with components
+        in the last dimension
+    """
+    volume = np.zeros((np.prod(shape), matrix.shape[1]), dtype=np.float32)
+    volume[voxels] = matrix
+    return volume.reshape(tuple(shape) + (matrix.shape[1],))
+
+
+def gather_from_volume(volume: np.ndarray, voxels: np.ndarray) -> np.ndarray:
+    """
+    Function to gather voxels of a volume
+    into the rows of a matrix,
+    all components at once.
+
+    Parameters
+    ----------
+    volume: np.ndarray
+        volume with components in
+        the last dimension
+    voxels: np.ndarray
+        flat voxel index of each row
+
+    Returns
+    -------
+    matrix: np.ndarray
+        voxels by components matrix
+    """
+    return volume.reshape(-1, volume.shape[-1])[voxels]
 
 
 def get_imaging_details_from_path(path: str) -> dict:
@@ -128,9 +246,8 @@ def save_white_matter(
     None
 
     """
-    lut_vol = nb.load(path_to_lookup_vol)
-    lut_vol_data = lut_vol.get_fdata().astype(np.int32)
-    lut_shape = sum(lut_vol_data.flatten() > 0)
+    lut_vol = lookup_volume(path_to_lookup_vol)
+    lut_shape = len(lut_vol["voxels"])
     white_matter_shape = white_matter_components.shape[1]
     if lut_shape != white_matter_shape:
         error_and_exit(
@@ -138,10 +255,38 @@ def save_white_matter(
             f"Lookup_tractspace_fdt_matrix2 size {lut_shape} is not compatible with white matter component size {white_matter_shape}",
         )
 
-    white_matter_vol = mat2vol(white_matter_components, lut_vol_data)
-    nb.Nifti1Image(
-        white_matter_vol.astype(float), header=lut_vol.header, affine=lut_vol.affine
-    ).to_filename(f"{out_file}.nii.gz")
+    white_matter_vol = scatter_to_volume(
+        white_matter_components[:, lut_vol["columns"]].T,
+        lut_vol["voxels"],
+        lut_vol["image"].shape,
+    )
+    save_float32_nifti(white_matter_vol, lut_vol["image"], f"{out_file}.nii.gz")
+
+
+def save_float32_nifti(
+    data: np.ndarray, reference: nb.Nifti1Image, file_name: str
+) -> None:
+    """
+    Function to save data as a float32
+    nifti in the space of a reference image.
+
+    Parameters
+    ----------
+    data: np.ndarray
+        data to save
+    reference: nb.Nifti1Image
+        image to take header
+        and affine from
+    file_name: str
+        file name
+
+    Returns
+    -------
+    None
+    """
+    image = nb.Nifti1Image(data, header=reference.header, affine=reference.affine)
+    image.set_data_dtype(np.float32)
+    image.to_filename(file_name)
 
 
 def save_grey_matter_volume(
@@ -174,15 +319,9 @@ def save_grey_matter_volume(
 
     vol = nb.load(seed)
     xyz_idx = np.ravel_multi_index(x_y_z_coordinates.T, vol.shape)
-    ncols = grey_matter_component.shape[1]
-    out = np.zeros(vol.shape + (ncols,)).reshape(-1, ncols)
-    for idx, col in enumerate(grey_matter_component.T):
-        out[xyz_idx, idx] = col
-    nb.Nifti1Image(
-        out.reshape(vol.shape + (ncols,)).astype(float),
-        affine=vol.affine,
-        header=vol.header,
-    ).to_filename(file_name)
+    save_float32_nifti(
+        scatter_to_volume(grey_matter_component, xyz_idx, vol.shape), vol, file_name
+    )
 
 
 def save_grey_matter_gifit(
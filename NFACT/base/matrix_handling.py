@@ -2,6 +2,11 @@ from NFACT.base.utils import colours, nprint
 from sklearn.preprocessing import StandardScaler
 import scipy.sparse as sps
 import numpy as np
+import hashlib
+import tempfile
+import glob
+import time
+import os
 
 
 def normalise_components(grey_matter: np.array, white_matter: np.array) -> dict:
@@ -30,7 +35,43 @@ def normalise_components(grey_matter: np.array, white_matter: np.array) -> dict:
     }
 
 
-def load_fdt_matrix(matfile: str) -> np.ndarray:
+def read_fdt_dot(matfile: str) -> dict:
+    """
+    Function to read a probtrackx
+    fdt_matrix2.dot file straight into
+    typed arrays (int32 indices and
+    float64 weights) rather than casting
+    the indices of a float64 array. The
+    last row of the file is the shape
+    of the matrix.
+
+    Parameters
+    ----------
+    matfile: str
+        path to file
+
+    Returns
+    -------
+    dict: dictionary
+        dict of zero indexed rows and
+        cols, data and shape of the
+        matrix
+    """
+    triplets = np.loadtxt(
+        matfile,
+        dtype=np.dtype([("rows", np.int32), ("cols", np.int32), ("data", np.float64)]),
+    )
+    return {
+        "rows": triplets["rows"][:-1] - 1,
+        "cols": triplets["cols"][:-1] - 1,
+        "data": triplets["data"][:-1],
+        "shape": (int(triplets["rows"][-1]), int(triplets["cols"][-1])),
+    }
+
+
+def load_fdt_matrix(
+    matfile: str, sparse: bool = False, cache_dir: str = None
+) -> np.ndarray:
     """
     Function to load a single fdt matrix
     as a ptx sparse matrix format.
@@ -39,17 +80,167 @@ def load_fdt_matrix(matfile: str) -> np.ndarray:
     ----------
     matfile: str
        path to file
+    sparse: bool
+        return the matrix as a
+        scipy sparse csr matrix
+        rather than a dense array.
+        Default is False
+    cache_dir: str
+        directory of converted matrix
+        cache. If given the matrix is read
+        from/written to the cache.
+        Default is None
 
     Returns
     -------
     sparse_matrix: np.array
        sparse matrix in numpy array
-       form.
-    """
-    mat = np.loadtxt(matfile)
-    data = mat[:-1, -1]
-    rows = np.array(mat[:-1, 0] - 1, dtype=int)
-    cols = np.array(mat[:-1, 1] - 1, dtype=int)
-    nrows = int(mat[-1, 0])
-    ncols = int(mat[-1, 1])
-    return sps.csc_matrix((data, (rows, cols)), shape=(nrows, ncols)).toarray()
+       form or as a csr matrix
+       if sparse is True.
+    """
+    if cache_dir:
+        sparse_matrix = cached_fdt_matrix(matfile, cache_dir)
+    else:
+        sparse_matrix = fdt_dot_to_csr(matfile)
+    if sparse:
+        return sparse_matrix
+    return sparse_matrix.toarray()
+
+
+def fdt_dot_to_csr(matfile: str) -> sps.csr_matrix:
+    """
+    Function to convert a fdt_matrix2.dot
+    file to a csr matrix.
+
+    Parameters
+    ----------
+    matfile: str
+       path to file
+
+    Returns
+    -------
+    sps.csr_matrix: sparse matrix
+        fdt matrix as a csr matrix
+    """
+    mat = read_fdt_dot(matfile)
+    return sps.csr_matrix((mat["data"], (mat["rows"], mat["cols"])), shape=mat["shape"])
+
+
+def matrix_cache_key(matfile: str) -> str:
+    """
+    Function to get the cache key
+    of a fdt matrix from its path,
+    size, modification time and the
+    dtype it is loaded as.
+
+    Parameters
+    ----------
+    matfile: str
+       path to file
+
+    Returns
+    -------
+    str: string
+        hash of file fingerprint
+    """
+    file_stats = os.stat(matfile)
+    # dtype is part of the key so matrices cached as float32 are not reused
+    fingerprint = (
+        f"{os.path.abspath(matfile)}:{file_stats.st_size}:{file_stats.st_mtime_ns}"
+        ":float64"
+    )
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def cached_fdt_matrix(matfile: str, cache_dir: str) -> sps.csr_matrix:
+    """
+    Function to load a fdt matrix from
+    the cache. If not cached then the
+    .dot file is converted once and saved
+    as a npz csr matrix.
+
+    Parameters
+    ----------
+    matfile: str
+       path to file
+    cache_dir: str
+        directory of cache
+
+    Returns
+    -------
+    sps.csr_matrix: sparse matrix
+        fdt matrix as a csr matrix
+    """
+    cache_file = os.path.join(cache_dir, f"{matrix_cache_key(matfile)}.npz")
+    if os.path.exists(cache_file):
+        try:
+            sparse_matrix = sps.load_npz(cache_file)
+            os.utime(cache_file)
+            return sparse_matrix
+        except Exception:
+            pass
+
+    sparse_matrix = fdt_dot_to_csr(matfile)
+    tmp_name = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=cache_dir, suffix=".tmp", delete=False
+        ) as tmp_file:
+            tmp_name = tmp_file.name
+            sps.save_npz(tmp_file, sparse_matrix, compressed=False)
+        os.replace(tmp_name, cache_file)
+    except Exception as e:
+        col = colours()
+        nprint(f"{col['red']}Unable to cache matrix due to {e}{col['reset']}")
+    finally:
+        # Only left behind if the write or rename failed
+        if tmp_name and os.path.exists(tmp_name):
+            os.remove(tmp_name)
+    return sparse_matrix
+
+
+def evict_matrix_cache(cache_dir: str, max_size: float, tmp_age: float = 86400) -> None:
+    """
+    Function to delete the least
+    recently used matrices from the
+    cache until it is under max_size.
+    .tmp files are only deleted once
+    they are older than tmp_age, as
+    younger ones may still be being
+    written by another job.
+
+    Parameters
+    ----------
+    cache_dir: str
+        directory of cache
+    max_size: float
+        maximum size of cache
+        in GB
+    tmp_age: float
+        age in seconds after which
+        a .tmp file is treated as
+        left over from a killed job.
+        Default is a day
+
+    Returns
+    -------
+    None
+    """
+    for tmp_file in glob.glob(os.path.join(cache_dir, "*.tmp")):
+        try:
+            if time.time() - os.path.getmtime(tmp_file) > tmp_age:
+                os.remove(tmp_file)
+        except OSError:
+            # Renamed or removed by its writer in the meantime
+            pass
+    cached_files = sorted(
+        glob.glob(os.path.join(cache_dir, "*.npz")), key=os.path.getmtime
+    )
+    cache_size = sum(os.path.getsize(cached) for cached in cached_files)
+    max_bytes = float(max_size) * 1024**3
+    for cached in cached_files:
+        if cache_size <= max_bytes:
+            break
+        cache_size -= os.path.getsize(cached)
+        os.remove(cached)
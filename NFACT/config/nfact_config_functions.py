@@ -157,6 +157,7 @@ def process_global_arguments(args: dict) -> dict:
     args["global_input"]["pp_skip"] = False
     args["global_input"]["dr_skip"] = False
     args["global_input"]["qc_skip"] = False
+    args["global_input"]["force"] = False
     return args
 
 
@@ -190,7 +191,8 @@ def reorganise_args(args: dict) -> dict:
                 (key == "nfact_decomp" and top_key in ["seeds"])
                 or (
                     key == "nfact_dr"
-                    and top_key in ["algo", "seeds", "nfact_decomp_dir", "decomp_dir"]
+                    and top_key
+                    in ["algo", "dim", "seeds", "nfact_decomp_dir", "decomp_dir"]
                 )
             )
         }
@@ -335,12 +337,43 @@ def create_combined_algo_dict() -> dict:
         arguments
     """
 
-    dictionary_to_save = {"ica": get_arguments(FastICA), "nmf": get_arguments(NMF)}
+    dictionary_to_save = {
+        "ica": get_arguments(FastICA),
+        "nmf": {**get_arguments(NMF), **nmf_engine_arguments()},
+    }
     del dictionary_to_save["nmf"]["n_components"]
     del dictionary_to_save["ica"]["n_components"]
     return dictionary_to_save
 
 
+def nmf_engine_arguments() -> dict:
+    """
+    Function to get the default
+    arguments of the NMF engines.
+    'batch' is sckit learns NMF and
+    'online' is MiniBatchNMF over row
+    blocks of the matrix.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    dict: dictionary object
+        dict of NMF engine
+        arguments
+    """
+    return {
+        "engine": "batch",
+        "batch_size": 1024,
+        "max_epochs": 50,
+        "forget_factor": 0.7,
+        "max_no_improvement": 10,
+        "validation_fraction": 0.1,
+    }
+
+
 def save_to_json(path: str, dictionary_to_save: dict, file_name: str) -> None:
     """
     Function to save nfact config file
@@ -2,6 +2,7 @@ from NFACT.base.logging import NFACT_logs
 from NFACT.base.utils import Timer, colours, nprint
 from NFACT.base.signithandler import Signit_handler
 from NFACT.base.filesystem import delete_folder
+from NFACT.base.matrix_handling import evict_matrix_cache
 from NFACT.base.setup import (
     check_subject_exist,
     check_algo,
@@ -20,11 +21,13 @@ from NFACT.decomp.setup.configure_setup import (
     check_config_file,
     load_config_file,
 )
-from NFACT.decomp.decomposition.decomp import matrix_decomposition, get_parameters
+from NFACT.decomp.decomposition.decomp import dimension_sweep, get_parameters
 from NFACT.decomp.decomposition.matrix_handling import (
     process_fdt_matrix2,
     load_previous_matrix,
     save_avg_matrix,
+    save_nmf_factors,
+    load_nmf_factors,
 )
 from NFACT.decomp.pipes.image_handling import winner_takes_all, save_images
 from NFACT.decomp.setup.arg_check import process_command_args
@@ -107,27 +110,44 @@ def nfact_decomp_main(args: dict = None) -> None:
     matrix_time.tic()
     print_str = f"{col['pink']}NFACT Matrix:{col['reset']}"
     fdt_2_conn = None
-    if os.path.exists(
-        os.path.join(
-            args["outdir"], "nfact_decomp", "group_averages", "average_matrix2.npy"
-        )
-    ):
+    if args["subject_migp"] and group_mode:
+        nprint(f"{print_str} Streaming subjects into MIGP")
+        fdt_2_conn = [
+            os.path.join(sub_folder, "fdt_matrix2.dot") for sub_folder in args["ptxdir"]
+        ]
+    group_averages = os.path.join(args["outdir"], "nfact_decomp", "group_averages")
+    average_matrix = os.path.join(
+        group_averages,
+        "average_matrix2.npz" if args["sparse"] else "average_matrix2.npy",
+    )
+    svd_cache = os.path.join(group_averages, "average_matrix2_svd.npz")
+    if fdt_2_conn is None and os.path.exists(average_matrix):
         nprint(f"{print_str} Loading previously saved")
-
-        fdt_2_conn = load_previous_matrix(
-            os.path.join(
-                args["outdir"], "nfact_decomp", "group_averages", "average_matrix2.npy"
-            )
-        )
+        fdt_2_conn = load_previous_matrix(average_matrix)
 
     if fdt_2_conn is None:
         nprint(f"{print_str} Averaging") if group_mode else nprint(
             f"{print_str} Loading Single Matrix"
         )
         save_directory = os.path.join(args["outdir"], "nfact_decomp", "group_averages")
-        fdt_2_conn = process_fdt_matrix2(args["ptxdir"], group_mode)
+        fdt_2_conn = process_fdt_matrix2(
+            args["ptxdir"],
+            group_mode,
+            args["sparse"],
+            args["cache_dir"],
+            args["n_cores"],
+            args["subjects_per_worker"],
+        )
         save_avg_matrix(fdt_2_conn, save_directory)
+        if os.path.exists(svd_cache):
+            # Singular vectors of the previous average are stale
+            os.remove(svd_cache)
         nprint(f"{col['pink']}Saving Matrix:{col['reset']} {save_directory}")
+        if not args["sparse"]:
+            # Re-open saved matrix memory mapped so reruns decompose the same way
+            fdt_2_conn = load_previous_matrix(average_matrix)
+        if args["cache_dir"]:
+            evict_matrix_cache(args["cache_dir"], args["cache_size"])
     nprint(
         f"{col['pink']}Matrix Loading Time:{col['reset']} {matrix_time.how_long()} \n"
     )
@@ -140,47 +160,71 @@ def nfact_decomp_main(args: dict = None) -> None:
     nprint("-" * 100)
     nprint(f"{col['pink']}NFACT method:{col['reset']} {args['algo'].upper()}")
 
-    components = matrix_decomposition(
+    if len(args["sweep"]) > 1:
+        nprint(
+            f"{col['pink']}Dimensions:{col['reset']} {', '.join(map(str, args['sweep']))}"
+        )
+    decomposition_args = {
+        "algo": args["algo"],
+        "normalise": args["normalise"],
+        "signflip": args["sign_flip"],
+        "pca_dim": args["components"],
+        "pca_type": args["pca_type"],
+        "oversampling": args["oversampling"],
+        "power_iterations": args["power_iterations"],
+        "cache_dir": args["cache_dir"],
+    }
+    previous_components = None
+    if args["warm_start"]:
+        previous_components = load_nmf_factors(group_averages, fdt_2_conn.shape)
+        nprint(
+            f"{col['pink']}Warm starting from:{col['reset']} {len(previous_components)} previous NMF(s)"
+        )
+    for dim, components in dimension_sweep(
         fdt_2_conn,
-        algo=args["algo"],
-        normalise=args["normalise"],
-        signflip=args["sign_flip"],
-        pca_dim=args["components"],
-        parameters=parameters,
-        pca_type=args["pca_type"],
-    )
-    nprint(
-        f"{col['pink']}Decomposition time:{col['reset']} {decomposition_timer.how_long()}\n"
-    )
-
-    # Save the results
-    save_images(
-        components,
-        os.path.join(
-            args["outdir"],
-            "nfact_decomp",
-        ),
-        args["seeds"],
-        args["algo"].upper(),
-        args["dim"],
-        args["roi"],
-    )
+        args["sweep"],
+        parameters,
+        decomposition_args,
+        args["n_cores"],
+        previous_components,
+        svd_cache,
+    ):
+        nprint(
+            f"{col['pink']}Decomposition time:{col['reset']} {decomposition_timer.how_long()}\n"
+        )
+        if args["algo"] == "nmf":
+            save_nmf_factors(components, group_averages, dim)
 
-    if args["wta"]:
-        # Save winner-takes-all maps
-        nprint("Saving winner-take-all maps\n")
-        winner_takes_all(
+        # Save the results
+        save_images(
             components,
-            args["wta_zthr"],
-            args["algo"].upper(),
             os.path.join(
                 args["outdir"],
                 "nfact_decomp",
             ),
             args["seeds"],
-            args["dim"],
+            args["algo"].upper(),
+            dim,
             args["roi"],
         )
+
+        if args["wta"]:
+            # Save winner-takes-all maps
+            nprint("Saving winner-take-all maps\n")
+            winner_takes_all(
+                components,
+                args["wta_zthr"],
+                args["algo"].upper(),
+                os.path.join(
+                    args["outdir"],
+                    "nfact_decomp",
+                ),
+                args["seeds"],
+                dim,
+                args["roi"],
+            )
+    if isinstance(fdt_2_conn, list) and args["cache_dir"]:
+        evict_matrix_cache(args["cache_dir"], args["cache_size"])
     nprint(f"{col['darker_pink']}NFACT decomp has finished{col['reset']}")
 
     log.clear_logging()
@@ -1,13 +1,37 @@
 from NFACT.decomp.decomposition.matrix_handling import (
     melodic_incremental_group_pca,
+    subject_migp,
+    rows_per_block,
+    centred_operator,
+    total_variance,
+    randomized_svd,
+    svd_factors,
+    nndsvd,
 )
 from NFACT.base.utils import error_and_exit, nprint, Timer
-from NFACT.base.matrix_handling import normalise_components
-from NFACT.config.nfact_config_functions import create_combined_algo_dict
-from sklearn.decomposition import FastICA, NMF, PCA
+from NFACT.base.matrix_handling import normalise_components, load_fdt_matrix
+from NFACT.config.nfact_config_functions import (
+    create_combined_algo_dict,
+    nmf_engine_arguments,
+    get_arguments,
+)
+from sklearn.decomposition import (
+    FastICA,
+    NMF,
+    MiniBatchNMF,
+    PCA,
+    IncrementalPCA,
+    TruncatedSVD,
+)
+from sklearn.utils import gen_batches
 import numpy as np
+import scipy.sparse as sps
+from scipy.sparse.linalg import svds
 from sklearn.utils._testing import ignore_warnings
 from sklearn.exceptions import ConvergenceWarning
+from threadpoolctl import threadpool_limits
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 import warnings
 
 warnings.filterwarnings("ignore")
@@ -15,7 +39,10 @@ warnings.filterwarnings("ignore")
 
 @ignore_warnings(category=ConvergenceWarning)
 def ica_decomp(
-    parameters: dict, pca_matrix: np.ndarray, fdt_matrix: np.ndarray
+    parameters: dict,
+    pca_matrix: np.ndarray,
+    fdt_matrix: np.ndarray,
+    cache_dir: str = None,
 ) -> dict:
     """
     Function to perform ica decomposition
@@ -28,7 +55,12 @@ def ica_decomp(
         matrix that has been reduced.
     fdt_matrix: np.ndarray
         matrix to perform decomposition
-        on
+        on. Can be a scipy sparse matrix
+        or a list of subjects' fdt_matrix2.dot
+        to average the white matter over
+    cache_dir: str
+        directory of converted matrix
+        cache. Default is None
 
     Returns
     -------
@@ -45,12 +77,82 @@ def ica_decomp(
         error_and_exit(False, f"Unable to perform ICA due to {e}")
     return {
         "grey_components": grey_matter,
-        "white_components": np.linalg.pinv(grey_matter) @ fdt_matrix,
+        "white_components": white_matter_projection(grey_matter, fdt_matrix, cache_dir),
     }
 
 
+def white_matter_projection(
+    grey_matter: np.ndarray, fdt_matrix: np.ndarray, cache_dir: str = None
+) -> np.ndarray:
+    """
+    Function to project the fdt matrix
+    onto the grey matter components to get
+    the white matter components. Keeps
+    sparse matrices sparse by multiplying
+    from the sparse side.
+
+    Parameters
+    ----------
+    grey_matter: np.ndarray
+        grey matter components
+    fdt_matrix: np.ndarray
+        matrix to project. Can be a
+        scipy sparse matrix or a list
+        of subjects' fdt_matrix2.dot to
+        average the projection over
+    cache_dir: str
+        directory of converted matrix
+        cache. Default is None
+
+    Returns
+    -------
+    np.ndarray: array
+        white matter components
+    """
+    if isinstance(fdt_matrix, list):
+        return subject_white_matter_projection(grey_matter, fdt_matrix, cache_dir)
+    if sps.issparse(fdt_matrix):
+        return np.asarray(fdt_matrix.T @ np.linalg.pinv(grey_matter).T).T
+    return np.linalg.pinv(grey_matter) @ fdt_matrix
+
+
+def subject_white_matter_projection(
+    grey_matter: np.ndarray, list_of_matfiles: list, cache_dir: str = None
+) -> np.ndarray:
+    """
+    Function to get the white matter
+    components of the group average
+    one subject at a time, so that the
+    group average is never built.
+
+    Parameters
+    ----------
+    grey_matter: np.ndarray
+        grey matter components
+    list_of_matfiles: list
+        list of paths to subjects'
+        fdt_matrix2.dot
+    cache_dir: str
+        directory of converted matrix
+        cache. Default is None
+
+    Returns
+    -------
+    np.ndarray: array
+        white matter components
+    """
+    grey_pinv = np.linalg.pinv(grey_matter).T
+    white_matter = 0
+    for matfile in list_of_matfiles:
+        fdt_matrix = load_fdt_matrix(matfile, True, cache_dir)
+        white_matter = white_matter + np.asarray(fdt_matrix.T @ grey_pinv)
+    return (white_matter / len(list_of_matfiles)).T
+
+
 @ignore_warnings(category=ConvergenceWarning)
-def nmf_decomp(parameters: dict, fdt_matrix: np.ndarray) -> dict:
+def nmf_decomp(
+    parameters: dict, fdt_matrix: np.ndarray, initialisation: dict = None
+) -> dict:
     """
     Function to perform NFM.
 
@@ -61,6 +163,10 @@ def nmf_decomp(parameters: dict, fdt_matrix: np.ndarray) -> dict:
     fdt_matrix: np.ndarray
         matrix to perform decomposition
         on
+    initialisation: dict
+        dictionary of grey and white
+        matter components to start from
+        as a custom init. Default is None
 
     Returns
     -------
@@ -68,15 +174,172 @@ def nmf_decomp(parameters: dict, fdt_matrix: np.ndarray) -> dict:
         dictionary of grey and white matter
         components
     """
+    engine_options = {
+        option: parameters.get(option, default)
+        for option, default in nmf_engine_arguments().items()
+    }
+    parameters = {
+        parameter: value
+        for parameter, value in parameters.items()
+        if parameter not in engine_options
+    }
+    if engine_options["engine"] == "online":
+        return online_nmf_decomp(parameters, engine_options, fdt_matrix, initialisation)
+    error_and_exit(
+        engine_options["engine"] == "batch",
+        f"{engine_options['engine']} is not an NMF engine. Options are batch or online",
+    )
+    start = {}
+    if initialisation:
+        parameters = {**parameters, "init": "custom"}
+        start = {
+            "W": initialisation["grey_components"].astype(fdt_matrix.dtype),
+            "H": initialisation["white_components"].astype(fdt_matrix.dtype),
+        }
     decomp = NMF(**parameters)
     try:
-        grey_matter = decomp.fit_transform(fdt_matrix)
+        grey_matter = decomp.fit_transform(fdt_matrix, **start)
     except Exception as e:
         error_and_exit(False, f"Unable to perform NMF due to {e}")
     return {"grey_components": grey_matter, "white_components": decomp.components_}
 
 
-def pca_reduction(n_components: int, fdt_matrix: np.ndarray) -> np.ndarray:
+@ignore_warnings(category=ConvergenceWarning)
+def online_nmf_decomp(
+    parameters: dict,
+    engine_options: dict,
+    fdt_matrix: np.ndarray,
+    initialisation: dict = None,
+) -> dict:
+    """
+    Function to perform NMF with sckit
+    learns MiniBatchNMF, reading the matrix
+    a block of rows at a time so that memory
+    mapped or sparse matrices are never fully
+    loaded. Stops early once the reconstruction
+    error of held out blocks stops improving.
+
+    Parameters
+    ----------
+    parameters: dict
+        dictionary of hyperparameters.
+        max_iter is not used
+    engine_options: dict
+        dictionary of batch_size, max_epochs
+        (maximum number of passes over the
+        matrix), forget_factor, max_no_improvement
+        and validation_fraction
+    fdt_matrix: np.ndarray
+        matrix to perform decomposition
+        on. Can be memory mapped or a
+        scipy sparse matrix
+    initialisation: dict
+        dictionary of grey and white
+        matter components to start from
+        as a custom init. Default is None
+
+    Returns
+    -------
+    dict: dictionary
+        dictionary of grey and white matter
+        components
+    """
+    online_arguments = get_arguments(MiniBatchNMF)
+    parameters = {
+        parameter: value
+        for parameter, value in parameters.items()
+        if parameter in online_arguments
+    }
+    max_epochs = int(engine_options["max_epochs"])
+    tol = parameters.get("tol", online_arguments["tol"])
+    patience = int(engine_options["max_no_improvement"])
+    batch_size = int(engine_options["batch_size"])
+    blocks = list(gen_batches(fdt_matrix.shape[0], batch_size))
+    random_state = np.random.default_rng(parameters.get("random_state"))
+    n_validation = int(len(blocks) * float(engine_options["validation_fraction"]))
+    n_validation = min(n_validation, len(blocks) - 1)
+    block_order = random_state.permutation(len(blocks))
+    validation_blocks = [blocks[block] for block in block_order[:n_validation]]
+    training_blocks = [blocks[block] for block in block_order[n_validation:]]
+
+    # partial_fit treats each block as the whole dataset and forgets
+    # by forget_factor per call, so it is scaled to the whole matrix
+    decomp = MiniBatchNMF(
+        **parameters,
+        batch_size=batch_size,
+        forget_factor=float(engine_options["forget_factor"])
+        ** (min(batch_size, fdt_matrix.shape[0]) / fdt_matrix.shape[0]),
+    )
+    best_error = np.inf
+    epochs_without_improvement = 0
+    try:
+        for epoch in range(max_epochs):
+            for block in random_state.permutation(len(training_blocks)):
+                rows = training_blocks[block]
+                if hasattr(decomp, "components_"):
+                    decomp.partial_fit(fdt_matrix[rows])
+                    continue
+                start = {}
+                if initialisation:
+                    decomp.set_params(init="custom")
+                    start = {
+                        "W": initialisation["grey_components"][rows].astype(
+                            fdt_matrix.dtype
+                        ),
+                        "H": initialisation["white_components"].astype(
+                            fdt_matrix.dtype
+                        ),
+                    }
+                decomp.partial_fit(fdt_matrix[rows], **start)
+            if not validation_blocks:
+                continue
+            error = sum(
+                held_out_error(decomp, fdt_matrix[rows]) for rows in validation_blocks
+            )
+            if parameters.get("verbose"):
+                nprint(f"Epoch {epoch + 1} held out error: {error:.4f}")
+            if error < best_error * (1 - tol):
+                best_error = error
+                epochs_without_improvement = 0
+                continue
+            epochs_without_improvement += 1
+            if epochs_without_improvement >= patience:
+                nprint(f"Stopping early after {epoch + 1} epochs")
+                break
+        grey_matter = np.vstack([decomp.transform(fdt_matrix[rows]) for rows in blocks])
+    except Exception as e:
+        error_and_exit(False, f"Unable to perform NMF due to {e}")
+    return {"grey_components": grey_matter, "white_components": decomp.components_}
+
+
+def held_out_error(decomp: object, block: np.ndarray) -> float:
+    """
+    Function to get the frobenius
+    reconstruction error of a block
+    of rows held out of NMF fitting.
+
+    Parameters
+    ----------
+    decomp: object
+        fitted MiniBatchNMF
+    block: np.ndarray
+        block of rows. Can be a
+        scipy sparse matrix
+
+    Returns
+    -------
+    float: float
+        sum of squared error
+    """
+    reconstruction = decomp.transform(block) @ decomp.components_
+    if sps.issparse(block):
+        block = block.toarray()
+    return float(np.square(block - reconstruction, dtype=np.float64).sum())
+
+
+def pca_reduction(
+    n_components: int, fdt_matrix: np.ndarray, incremental: bool = False
+) -> np.ndarray:
     """
     Function to conduct PCA for ICA using
     sckit learns implementation.
@@ -86,17 +349,196 @@ def pca_reduction(n_components: int, fdt_matrix: np.ndarray) -> np.ndarray:
     n_components: int
         number of components to retain
     fdt_matrix: np.array
-        connectivity matrix
+        connectivity matrix. If sparse
+        uses the arpack solver which
+        implicitly centres the matrix.
+    incremental: bool
+        use incremental PCA over row
+        blocks so that a memory mapped matrix
+        is never fully loaded. This approximates
+        PCA. Default is False
     """
     timer = Timer()
     timer.tic()
-    pca_matrix = PCA(n_components).fit_transform(fdt_matrix)
+    if incremental:
+        nprint("Using incremental PCA over row blocks")
+        pca_matrix = incremental_pca_reduction(n_components, fdt_matrix)
+    else:
+        svd_solver = "arpack" if sps.issparse(fdt_matrix) else "auto"
+        pca = PCA(n_components, svd_solver=svd_solver)
+        pca_matrix = pca.fit_transform(fdt_matrix)
+        nprint(f"Explained variance: {pca.explained_variance_ratio_.sum() * 100:.2f}%")
     nprint(f"Old matrix size {fdt_matrix.shape[0]}x{fdt_matrix.shape[1]}")
     nprint(f"New matrix size now {pca_matrix.shape[0]}x{pca_matrix.shape[1]}")
     nprint(f"PCA finished in {timer.how_long()}\n")
     return pca_matrix
 
 
+def incremental_pca_reduction(n_components: int, fdt_matrix: np.ndarray) -> np.ndarray:
+    """
+    Function to conduct PCA on a memory
+    mapped matrix in row blocks so that
+    only one block is read into memory
+    at a time.
+
+    Parameters
+    ----------
+    n_components: int
+        number of components to retain
+    fdt_matrix: np.array
+        connectivity matrix. Can be memory
+        mapped or a scipy sparse matrix
+
+    Returns
+    -------
+    pca_matrix: np.ndarray
+        reduced matrix
+    """
+    block_size = rows_per_block(fdt_matrix, n_components)
+    pca = IncrementalPCA(n_components, copy=False)
+    for block in gen_batches(
+        fdt_matrix.shape[0], block_size, min_batch_size=n_components
+    ):
+        pca.partial_fit(dense_rows(fdt_matrix, block))
+    nprint(f"Explained variance: {pca.explained_variance_ratio_.sum() * 100:.2f}%")
+    return np.vstack(
+        [
+            pca.transform(dense_rows(fdt_matrix, block))
+            for block in gen_batches(fdt_matrix.shape[0], block_size)
+        ]
+    )
+
+
+def dense_rows(fdt_matrix: np.ndarray, rows: slice) -> np.ndarray:
+    """
+    Function to read a block of rows
+    of a matrix as a dense array.
+
+    Parameters
+    ----------
+    fdt_matrix: np.ndarray
+        matrix. Can be memory mapped
+        or a scipy sparse matrix
+    rows: slice
+        rows to read
+
+    Returns
+    -------
+    np.ndarray: array
+        dense block of rows
+    """
+    if sps.issparse(fdt_matrix):
+        return fdt_matrix[rows].toarray()
+    return np.asarray(fdt_matrix[rows])
+
+
+def svd_reduction(
+    n_components: int,
+    fdt_matrix: np.ndarray,
+    pca_type: str,
+    oversampling: int = 10,
+    power_iterations: int = 4,
+) -> np.ndarray:
+    """
+    Function to conduct a truncated SVD
+    reduction for ICA. Only the components
+    asked for are computed rather than a
+    full decomposition.
+
+    Parameters
+    ----------
+    n_components: int
+        number of components to retain
+    fdt_matrix: np.array
+        connectivity matrix. Can be memory
+        mapped or a scipy sparse matrix
+    pca_type: str
+        engine to use. 'randomized' for a
+        randomized SVD, 'truncated' for scikit
+        learn's TruncatedSVD (no centring),
+        'arpack' or 'lobpcg' for the scipy
+        iterative solvers. All but 'truncated'
+        centre the matrix implicitly.
+    oversampling: int
+        number of extra random vectors
+        for the randomized engines. Default is 10
+    power_iterations: int
+        number of power iterations
+        for the randomized engines. Default is 4
+
+    Returns
+    -------
+    pca_matrix: np.ndarray
+        reduced matrix
+    """
+    timer = Timer()
+    timer.tic()
+    if pca_type == "truncated":
+        svd = TruncatedSVD(
+            n_components,
+            n_oversamples=oversampling,
+            n_iter=power_iterations,
+            random_state=1,
+        )
+        pca_matrix = svd.fit_transform(fdt_matrix)
+        explained_variance = svd.explained_variance_ratio_.sum()
+    else:
+        operator = centred_operator(fdt_matrix)
+        if pca_type == "randomized":
+            left, singular_values, _ = randomized_svd(
+                operator, n_components, oversampling, power_iterations
+            )
+        else:
+            left, singular_values = iterative_svd(operator, n_components, pca_type)
+            order = np.argsort(singular_values)[::-1]
+            left, singular_values = left[:, order], singular_values[order]
+        pca_matrix = left * singular_values
+        explained_variance = np.square(singular_values).sum() / total_variance(
+            fdt_matrix
+        )
+    nprint(f"Explained variance: {explained_variance * 100:.2f}%")
+    nprint(f"Old matrix size {fdt_matrix.shape[0]}x{fdt_matrix.shape[1]}")
+    nprint(f"New matrix size now {pca_matrix.shape[0]}x{pca_matrix.shape[1]}")
+    nprint(f"{pca_type} SVD finished in {timer.how_long()}\n")
+    return pca_matrix
+
+
+def iterative_svd(operator: object, n_components: int, solver: str) -> tuple:
+    """
+    Function to do a truncated SVD with
+    one of scipy's iterative solvers. If
+    lobpcg does not converge arpack is
+    used instead.
+
+    Parameters
+    ----------
+    operator: object
+        matrix or LinearOperator
+        to factorise
+    n_components: int
+        number of singular vectors to keep
+    solver: str
+        'arpack' or 'lobpcg'
+
+    Returns
+    -------
+    tuple: tuple
+        left singular vectors and
+        singular values
+    """
+    with warnings.catch_warnings(record=True) as solver_warnings:
+        warnings.simplefilter("always")
+        left, singular_values, _ = svds(
+            operator, n_components, solver=solver, random_state=1
+        )
+    if solver == "lobpcg" and solver_warnings:
+        nprint("lobpcg did not converge. Using arpack instead")
+        left, singular_values, _ = svds(
+            operator, n_components, solver="arpack", random_state=1
+        )
+    return left, singular_values
+
+
 def get_parameters(parameters: dict, algo: str, n_components: int) -> dict:
     """
     Function to get parameters for
@@ -141,6 +583,12 @@ def matrix_decomposition(
     pca_dim: int,
     parameters: dict,
     pca_type: str,
+    oversampling: int = 10,
+    power_iterations: int = 4,
+    cache_dir: str = None,
+    pca_matrix: np.ndarray = None,
+    init_components: dict = None,
+    svd: tuple = None,
 ) -> dict:
     """
     Wrapper function to decompose a matrix2 into
@@ -152,7 +600,11 @@ def matrix_decomposition(
     Parameters
     ----------
     fdt_matrix: np.ndarray
-        matrix to decompose
+        matrix to decompose. Can be
+        a scipy sparse matrix or for ICA
+        a list of subjects' fdt_matrix2.dot
+        to stream through MIGP without
+        building the group average
     algo: str
         which algo
     normalise: bool
@@ -163,6 +615,29 @@ def matrix_decomposition(
         number of pca dimensions for ICA
     pca_type: str
         type of PCA to do
+    oversampling: int
+        oversampling for the
+        randomized PCA engines
+    power_iterations: int
+        power iterations for the
+        randomized PCA engines
+    cache_dir: str
+        directory of converted matrix
+        cache used when fdt_matrix is a
+        list of subjects. Default is None
+    pca_matrix: np.ndarray
+        reduced matrix for ICA from
+        reduce_matrix. Default is None
+        which reduces fdt_matrix
+    init_components: dict
+        grey and white matter components
+        of a previous NMF to warm start from.
+        Can have a different number of components.
+        Default is None
+    svd: tuple
+        singular vectors of fdt_matrix
+        from svd_factors to get the NNDSVD init
+        from. Default is None
 
     Returns
     -------
@@ -171,12 +646,11 @@ def matrix_decomposition(
     """
 
     if algo == "ica":
-        if pca_type == "pca":
-            nprint("Doing PCA reduction")
-            pca_matrix = pca_reduction(pca_dim, fdt_matrix)
-        else:
-            pca_matrix = melodic_incremental_group_pca(fdt_matrix, pca_dim, pca_dim)
-        components = ica_decomp(parameters, pca_matrix, fdt_matrix)
+        if pca_matrix is None:
+            pca_matrix = reduce_matrix(
+                fdt_matrix, pca_dim, pca_type, oversampling, power_iterations, cache_dir
+            )
+        components = ica_decomp(parameters, pca_matrix, fdt_matrix, cache_dir)
 
         if signflip:
             nprint("Sign-flipping components")
@@ -184,7 +658,10 @@ def matrix_decomposition(
             components["white_components"] = sign_flip(components["white_components"])
 
     if algo == "nmf":
-        components = nmf_decomp(parameters, fdt_matrix)
+        initialisation = nmf_initialisation(
+            fdt_matrix, parameters, init_components, svd
+        )
+        components = nmf_decomp(parameters, fdt_matrix, initialisation)
 
     if normalise:
         normalised = normalise_components(
@@ -196,7 +673,312 @@ def matrix_decomposition(
     return components
 
 
-def sign_flip(decomp_matrix: np.ndarray, thr: int = 0) -> np.ndarray:
+def nmf_initialisation(
+    fdt_matrix: np.ndarray,
+    parameters: dict,
+    init_components: dict = None,
+    svd: tuple = None,
+) -> dict:
+    """
+    Function to get a custom NMF init when
+    warm starting. Components of a previous
+    NMF are kept, strongest first, and any
+    extra components are taken from the
+    NNDSVD init. Without previous components
+    the init is left to sckit learn.
+
+    Parameters
+    ----------
+    fdt_matrix: np.ndarray
+        matrix to decompose
+    parameters: dict
+        dictionary of hyperparameters
+    init_components: dict
+        grey and white matter components
+        of a previous NMF. Default is None
+    svd: tuple
+        singular vectors of fdt_matrix.
+        Default is None
+
+    Returns
+    -------
+    dict: dictionary
+        grey and white matter components
+        to start from or None to use the
+        init in parameters
+    """
+    n_components = parameters["n_components"]
+    if init_components is None:
+        return None
+
+    previous_grey = init_components["grey_components"]
+    previous_white = init_components["white_components"]
+    n_previous = min(previous_grey.shape[1], n_components)
+    if n_previous < n_components:
+        if svd is None:
+            svd = randomized_svd(fdt_matrix, n_components)
+        grey_matter, white_matter = nndsvd(*svd, n_components)
+    else:
+        grey_matter = np.zeros((fdt_matrix.shape[0], n_components))
+        white_matter = np.zeros((n_components, fdt_matrix.shape[1]))
+    strength = np.linalg.norm(previous_grey, axis=0) * np.linalg.norm(
+        previous_white, axis=1
+    )
+    strongest = np.argsort(strength)[::-1][:n_previous]
+    grey_matter[:, :n_previous] = previous_grey[:, strongest]
+    white_matter[:n_previous] = previous_white[strongest]
+    return {"grey_components": grey_matter, "white_components": white_matter}
+
+
+def closest_components(previous_components: dict, dim: int) -> dict:
+    """
+    Function to pick the previous NMF to
+    warm start a dimension from. The same
+    dimension is used if there is one, then the
+    largest lower dimension, then the smallest
+    higher dimension.
+
+    Parameters
+    ----------
+    previous_components: dict
+        dictionary of dim to
+        dict of components
+    dim: int
+        number of dimensions
+
+    Returns
+    -------
+    dict: dictionary
+        dict of components or None
+    """
+    if not previous_components:
+        return None
+    lower = [previous for previous in previous_components if previous <= dim]
+    closest = max(lower) if lower else min(previous_components)
+    return previous_components[closest]
+
+
+def reduce_matrix(
+    fdt_matrix: np.ndarray,
+    pca_dim: int,
+    pca_type: str,
+    oversampling: int = 10,
+    power_iterations: int = 4,
+    cache_dir: str = None,
+) -> np.ndarray:
+    """
+    Function to reduce a matrix2
+    before ICA.
+
+    Parameters
+    ----------
+    fdt_matrix: np.ndarray
+        matrix to reduce. Can be
+        a scipy sparse matrix or
+        a list of subjects' fdt_matrix2.dot
+        to stream through MIGP
+    pca_dim: int
+        number of pca dimensions
+    pca_type: str
+        type of PCA to do
+    oversampling: int
+        oversampling for the
+        randomized PCA engines
+    power_iterations: int
+        power iterations for the
+        randomized PCA engines
+    cache_dir: str
+        directory of converted matrix
+        cache used when fdt_matrix is a
+        list of subjects. Default is None
+
+    Returns
+    -------
+    pca_matrix: np.ndarray
+        reduced matrix
+    """
+    if isinstance(fdt_matrix, list):
+        return subject_migp(fdt_matrix, pca_dim, pca_dim, cache_dir)
+    if pca_type in ["pca", "incremental"]:
+        nprint("Doing PCA reduction")
+        return pca_reduction(pca_dim, fdt_matrix, pca_type == "incremental")
+    if pca_type == "migp":
+        return melodic_incremental_group_pca(fdt_matrix, pca_dim, pca_dim)
+    nprint(f"Doing {pca_type} SVD reduction")
+    return svd_reduction(pca_dim, fdt_matrix, pca_type, oversampling, power_iterations)
+
+
+def dimension_sweep(
+    fdt_matrix: np.ndarray,
+    dims: list,
+    parameters: dict,
+    decomposition_args: dict,
+    n_cores: int = False,
+    previous_components: dict = None,
+    svd_cache: str = None,
+):
+    """
+    Generator to decompose a matrix2 at
+    several dimensions. The ICA reduction and,
+    when warm starting NMF, the NNDSVD singular
+    vectors are computed once and shared by
+    every dimension.
+    If n_cores is given the decompositions
+    are ran across a process pool, unless
+    the matrix is sparse as it would be
+    copied in full to every process.
+
+    Parameters
+    ----------
+    fdt_matrix: np.ndarray
+        matrix to decompose. Memory mapped
+        matrices are re-opened by each process
+        rather than copied to it
+    dims: list
+        list of dimensions
+    parameters: dict
+        dictionary of hyperparameters
+    decomposition_args: dict
+        dictionary of matrix_decomposition
+        arguments other than fdt_matrix,
+        parameters and pca_matrix
+    n_cores: int
+        number of processes. Default is
+        False which decomposes serially
+    previous_components: dict
+        dictionary of dim to components of
+        previous NMFs to warm start from. When
+        ran serially each dimension is also
+        warm started from the one before it.
+        Default is None which does not warm start
+    svd_cache: str
+        path to cache NNDSVD singular vectors
+        in when warm starting. Default is None
+
+    Yields
+    ------
+    tuple: tuple object
+        dimension and dict of components
+        in the order they finish
+    """
+    pca_matrix = None
+    if decomposition_args["algo"] == "ica":
+        pca_matrix = reduce_matrix(
+            fdt_matrix,
+            decomposition_args["pca_dim"],
+            decomposition_args["pca_type"],
+            decomposition_args["oversampling"],
+            decomposition_args["power_iterations"],
+            decomposition_args["cache_dir"],
+        )
+    svd = None
+    warm_start = previous_components is not None
+    if decomposition_args["algo"] == "nmf" and warm_start:
+        svd = svd_factors(fdt_matrix, max(dims), svd_cache)
+    n_processes = min(int(n_cores), len(dims)) if n_cores else 0
+    if n_processes > 1 and sps.issparse(fdt_matrix):
+        nprint(
+            "Sparse matrices cannot be shared between processes. Decomposing serially"
+        )
+        n_processes = 0
+    if n_processes <= 1:
+        for dim in dims:
+            components = decompose_dimension(
+                fdt_matrix,
+                dim,
+                parameters,
+                decomposition_args,
+                pca_matrix,
+                closest_components(previous_components, dim),
+                svd,
+            )
+            if warm_start:
+                previous_components[dim] = components
+            yield dim, components
+        return
+
+    if isinstance(fdt_matrix, np.memmap):
+        fdt_matrix = fdt_matrix.filename
+    threads = max(1, (os.cpu_count() or 1) // n_processes)
+    with ProcessPoolExecutor(max_workers=n_processes) as executor:
+        futures = {
+            executor.submit(
+                decompose_dimension,
+                fdt_matrix,
+                dim,
+                parameters,
+                decomposition_args,
+                pca_matrix,
+                closest_components(previous_components, dim),
+                svd,
+                threads,
+            ): dim
+            for dim in dims
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def decompose_dimension(
+    fdt_matrix: np.ndarray,
+    dim: int,
+    parameters: dict,
+    decomposition_args: dict,
+    pca_matrix: np.ndarray = None,
+    init_components: dict = None,
+    svd: tuple = None,
+    threads: int = None,
+) -> dict:
+    """
+    Function to decompose a matrix2
+    at one dimension of a sweep.
+
+    Parameters
+    ----------
+    fdt_matrix: np.ndarray
+        matrix to decompose or path
+        to a .npy matrix to memory map
+    dim: int
+        number of dimensions
+    parameters: dict
+        dictionary of hyperparameters
+    decomposition_args: dict
+        dictionary of matrix_decomposition
+        arguments
+    pca_matrix: np.ndarray
+        reduced matrix for ICA.
+        Default is None
+    init_components: dict
+        components of a previous NMF
+        to warm start from. Default is None
+    svd: tuple
+        singular vectors for the NNDSVD
+        init. Default is None
+    threads: int
+        number of BLAS threads to use.
+        Default is None which uses all
+
+    Returns
+    -------
+    dict: dictionary
+        dict of components
+    """
+    if isinstance(fdt_matrix, str):
+        fdt_matrix = np.load(fdt_matrix, mmap_mode="r")
+    with threadpool_limits(threads):
+        return matrix_decomposition(
+            fdt_matrix,
+            parameters={**parameters, "n_components": dim},
+            pca_matrix=pca_matrix,
+            init_components=init_components,
+            svd=svd,
+            **decomposition_args,
+        )
+
+
+def sign_flip(
+    decomp_matrix: np.ndarray, thr: int = 0, chunk_size: int = None
+) -> np.ndarray:
     """
     Function to sign flip the rows of
     the decomp matrix so that the heavy tail
@@ -209,29 +991,76 @@ def sign_flip(decomp_matrix: np.ndarray, thr: int = 0) -> np.ndarray:
 
     thr: int=0
         threshold value
+    chunk_size: int=None
+        number of rows to sign flip at
+        once. Default is None which uses
+        blocks of about 8MB
 
     Returns
     -------
     signflip_decomp_matrix: np.array
         array of signfliped matrix
     """
-
+    if chunk_size is None:
+        # Small blocks keep the temporaries in cache
+        chunk_size = rows_per_block(decomp_matrix, block_memory=2**23)
     signflip_decomp_matrix = np.empty_like(decomp_matrix)
-    for index in range(decomp_matrix.shape[0]):
-        row = decomp_matrix[index]
-        rowthr = row[np.abs(row) > thr]
-
-        if rowthr.size == 0 or np.min(np.abs(rowthr)) == 0:
-            signflip_decomp_matrix[index] = row
-            continue
+    for start in range(0, decomp_matrix.shape[0], chunk_size):
+        block = decomp_matrix[start : start + chunk_size]
+        signflip_decomp_matrix[start : start + chunk_size] = block * row_skew(
+            block, thr
+        ).astype(block.dtype)
+    return signflip_decomp_matrix
 
-        positive_elements = row[row > thr]
-        negative_elements = row[row < -thr]
 
-        positive_mean = np.mean(positive_elements) if positive_elements.size > 0 else 0
-        negative_mean = -np.mean(negative_elements) if negative_elements.size > 0 else 0
+def row_skew(matrix: np.ndarray, thr: int = 0) -> np.ndarray:
+    """
+    Function to get the sign of the
+    heavy tail of each row of a matrix,
+    comparing the mean of the values above
+    thr with the mean absolute value of those
+    below -thr.
 
-        skew = np.sign(positive_mean - negative_mean)
-        signflip_decomp_matrix[index] = row if skew == 0 else row * skew
+    Parameters
+    ----------
+    matrix: np.ndarray
+        matrix
+    thr: int=0
+        threshold value
 
-    return signflip_decomp_matrix
+    Returns
+    -------
+    skew: np.ndarray
+        column vector of 1 or -1 per row.
+        Rows without values beyond thr
+        or that are tied are 1
+    """
+    n_columns = matrix.shape[1]
+    positive_count = np.count_nonzero(matrix > thr, axis=1)
+    negative_count = np.count_nonzero(matrix < -thr, axis=1)
+    # Values not beyond thr are clipped to thr so they can be removed from the sums
+    positive_sum = np.maximum(matrix, thr).sum(axis=1) - thr * (
+        n_columns - positive_count
+    )
+    negative_sum = np.minimum(matrix, -thr).sum(axis=1) + thr * (
+        n_columns - negative_count
+    )
+    positive_mean = np.divide(
+        positive_sum,
+        positive_count,
+        out=np.zeros(matrix.shape[0]),
+        where=positive_count > 0,
+    )
+    negative_mean = -np.divide(
+        negative_sum,
+        negative_count,
+        out=np.zeros(matrix.shape[0]),
+        where=negative_count > 0,
+    )
+    skew = np.sign(positive_mean - negative_mean)
+    if thr >= 0:
+        unchanged = positive_count + negative_count == 0
+    else:
+        unchanged = (matrix == 0).any(axis=1)
+    skew[(skew == 0) | unchanged] = 1
+    return skew[:, np.newaxis]
@@ -1,12 +1,23 @@
 import numpy as np
 from tqdm import tqdm
-from scipy.sparse.linalg import eigsh
+from scipy.sparse.linalg import LinearOperator
+import scipy.sparse as sps
 import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from glob import glob
 from NFACT.base.utils import Timer, error_and_exit, colours, nprint
 from NFACT.base.matrix_handling import load_fdt_matrix
 
 
-def process_fdt_matrix2(list_of_ptx_folds: list, group_mode: bool) -> np.ndarray:
+def process_fdt_matrix2(
+    list_of_ptx_folds: list,
+    group_mode: bool,
+    sparse: bool = False,
+    cache_dir: str = None,
+    n_cores: int = False,
+    subjects_per_worker: int = 1,
+) -> np.ndarray:
     """
     Function to get group average matrix
 
@@ -14,6 +25,21 @@ def process_fdt_matrix2(list_of_ptx_folds: list, group_mode: bool) -> np.ndarray
     ----------
     list_of_ptx_folds: list
         list of probtrackx folders
+    group_mode: bool
+        average across subjects
+    sparse: bool
+        keep the matrix as a scipy
+        sparse csr matrix. Default is False
+    cache_dir: str
+        directory of converted matrix
+        cache. Default is None
+    n_cores: int
+        number of processes to average
+        subjects with. Default is False
+    subjects_per_worker: int
+        number of subjects each process
+        sums before returning a partial
+        sum. Default is 1
 
     Returns
     -------
@@ -26,12 +52,14 @@ def process_fdt_matrix2(list_of_ptx_folds: list, group_mode: bool) -> np.ndarray
     ]
     if group_mode:
         try:
-            fdt_matrix2 = avg_fdt(list_of_fdt)
+            fdt_matrix2 = avg_fdt(
+                list_of_fdt, sparse, cache_dir, n_cores, subjects_per_worker
+            )
         except Exception as e:
             error_and_exit(False, f"Unable to load fdt_matrix2 due to {e}")
     if not group_mode:
         try:
-            fdt_matrix2 = load_fdt_matrix(list_of_fdt[0])
+            fdt_matrix2 = load_fdt_matrix(list_of_fdt[0], sparse, cache_dir)
         except Exception as e:
             error_and_exit(False, f"Unable to load fdt_matrix2 due to {e}")
     return fdt_matrix2
@@ -40,6 +68,9 @@ def process_fdt_matrix2(list_of_ptx_folds: list, group_mode: bool) -> np.ndarray
 def load_previous_matrix(path: str) -> np.ndarray:
     """
     Function to load previous matrix.
+    Loads .npz files as sparse
+    csr matrices and .npy files as
+    read only memory mapped arrays.
 
     Parameters
     ----------
@@ -53,7 +84,9 @@ def load_previous_matrix(path: str) -> np.ndarray:
     """
 
     try:
-        fdt = np.load(os.path.join(path))
+        if path.endswith(".npz"):
+            return sps.load_npz(path)
+        fdt = np.load(os.path.join(path), mmap_mode="r")
         return fdt
     except Exception:
         col = colours()
@@ -65,7 +98,8 @@ def load_previous_matrix(path: str) -> np.ndarray:
 
 def save_avg_matrix(matrix: np.array, directory: str) -> None:
     """
-    Function to save average matrix as npz file
+    Function to save average matrix as npy file
+    or as a npz file if the matrix is sparse
 
     Parameters
     ----------
@@ -80,37 +114,357 @@ def save_avg_matrix(matrix: np.array, directory: str) -> None:
     None
     """
     try:
+        if sps.issparse(matrix):
+            sps.save_npz(os.path.join(directory, "average_matrix2"), matrix)
+            return None
         np.save(os.path.join(directory, "average_matrix2"), matrix)
     except Exception as e:
         error_and_exit(False, f"Unable to save matrix due to {e}")
 
 
-def avg_fdt(list_of_matfiles: list) -> np.ndarray:
+def save_nmf_factors(components: dict, directory: str, dim: int) -> None:
+    """
+    Function to save the NMF factors
+    of a decomposition so that later runs
+    can warm start from them.
+
+    Parameters
+    ----------
+    components: dict
+        dictionary of components
+    directory: str
+        path to group_average folder in the nfact
+        folder
+    dim: int
+        number of dimensions
+
+    Returns
+    -------
+    None
+    """
+    np.savez(
+        os.path.join(directory, f"nmf_factors_dim{dim}.npz"),
+        grey_components=components["grey_components"],
+        white_components=components["white_components"],
+    )
+
+
+def load_nmf_factors(directory: str, shape: tuple) -> dict:
+    """
+    Function to load previously saved
+    NMF factors.
+
+    Parameters
+    ----------
+    directory: str
+        path to group_average folder in the nfact
+        folder
+    shape: tuple
+        shape of the matrix being decomposed.
+        Factors of other shapes are ignored
+
+    Returns
+    -------
+    dict: dictionary
+        dictionary of dim to dict
+        of components
+    """
+    factors = {}
+    for factor_file in glob(os.path.join(directory, "nmf_factors_dim*.npz")):
+        with np.load(factor_file) as saved:
+            components = {name: saved[name] for name in saved.files}
+        if (
+            components["grey_components"].shape[0] == shape[0]
+            and components["white_components"].shape[1] == shape[1]
+        ):
+            factors[components["grey_components"].shape[1]] = components
+    return factors
+
+
+def svd_factors(
+    fdt_matrix: np.ndarray, n_components: int, cache_path: str = None
+) -> tuple:
+    """
+    Function to get the leading singular
+    vectors of a matrix for NNDSVD. Factors
+    are cached at cache_path and re-used while
+    they have at least n_components.
+
+    Parameters
+    ----------
+    fdt_matrix: np.ndarray
+        matrix. Can be memory mapped
+        or a scipy sparse matrix
+    n_components: int
+        number of singular vectors
+    cache_path: str
+        path to .npz cache of factors.
+        Default is None which does not cache
+
+    Returns
+    -------
+    tuple: tuple
+        left singular vectors, singular values
+        and right singular vectors
+    """
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            left, singular_values, right = (
+                cached["left"],
+                cached["singular_values"],
+                cached["right"],
+            )
+        if (
+            left.shape[0] == fdt_matrix.shape[0]
+            and right.shape[1] == fdt_matrix.shape[1]
+            and singular_values.shape[0] >= n_components
+        ):
+            return left, singular_values, right
+    left, singular_values, right = randomized_svd(fdt_matrix, n_components)
+    if cache_path:
+        np.savez(cache_path, left=left, singular_values=singular_values, right=right)
+    return left, singular_values, right
+
+
+def nndsvd(
+    left: np.ndarray,
+    singular_values: np.ndarray,
+    right: np.ndarray,
+    n_components: int,
+    eps: float = 1e-6,
+) -> tuple:
+    """
+    Function to get the non-negative double
+    SVD (Boutsidis & Gallopoulos 2008) NMF
+    initialisation from singular vectors.
+    Same as scikit learns nndsvd init.
+
+    Parameters
+    ----------
+    left: np.ndarray
+        left singular vectors
+    singular_values: np.ndarray
+        singular values
+    right: np.ndarray
+        right singular vectors
+    n_components: int
+        number of components
+    eps: float
+        values below eps are set to 0.
+        Default is 1e-6
+
+    Returns
+    -------
+    tuple: tuple
+        grey (W) and white (H) matter
+        initialisation
+    """
+    grey_matter = np.zeros((left.shape[0], n_components))
+    white_matter = np.zeros((n_components, right.shape[1]))
+    grey_matter[:, 0] = np.sqrt(singular_values[0]) * np.abs(left[:, 0])
+    white_matter[0] = np.sqrt(singular_values[0]) * np.abs(right[0])
+    for component in range(1, n_components):
+        left_vector, right_vector = left[:, component], right[component]
+        left_parts = np.maximum(left_vector, 0), np.abs(np.minimum(left_vector, 0))
+        right_parts = np.maximum(right_vector, 0), np.abs(np.minimum(right_vector, 0))
+        norms = [
+            (np.linalg.norm(left_part), np.linalg.norm(right_part))
+            for left_part, right_part in zip(left_parts, right_parts)
+        ]
+        # Keep whichever of the positive or negative parts is larger
+        part = 0 if norms[0][0] * norms[0][1] > norms[1][0] * norms[1][1] else 1
+        left_norm, right_norm = norms[part]
+        scale = np.sqrt(singular_values[component] * left_norm * right_norm)
+        if left_norm and right_norm:
+            grey_matter[:, component] = scale * left_parts[part] / left_norm
+            white_matter[component] = scale * right_parts[part] / right_norm
+    grey_matter[grey_matter < eps] = 0
+    white_matter[white_matter < eps] = 0
+    return grey_matter, white_matter
+
+
+def avg_fdt(
+    list_of_matfiles: list,
+    sparse: bool = False,
+    cache_dir: str = None,
+    n_cores: int = False,
+    subjects_per_worker: int = 1,
+) -> np.ndarray:
     """
     Function to create and create
-    an average group matrix.
+    an average group matrix. Matrices are
+    added into a single running sum
+    (float64 or sparse) as they are loaded.
 
     Parameters
     ----------
     list_of_matfiles: list
         list of matricies
         for the group.
-    waytotal_path: str
-        waytotal path
+    sparse: bool
+        keep the average as a scipy
+        sparse csr matrix. Default is False
+    cache_dir: str
+        directory of converted matrix
+        cache. Default is None
+    n_cores: int
+        number of processes to load
+        matrices with. Default is False
+        which loads serially
+    subjects_per_worker: int
+        number of subjects each worker
+        sums before returning a partial
+        sum (tree reduction). Default is 1
 
     Returns
     -------
     sparse_matrix: np.array
         np.array of sparse matrix.
     """
-    sparse_matrix = 0.0
-    for matrix in tqdm(list_of_matfiles, colour="magenta", unit="Matrices"):
-        sparse_matrix += load_fdt_matrix(matrix)
+    batches = [
+        list_of_matfiles[idx : idx + subjects_per_worker]
+        for idx in range(0, len(list_of_matfiles), subjects_per_worker)
+    ]
+    sparse_matrix = None
+    with tqdm(
+        total=len(list_of_matfiles), colour="magenta", unit="Matrices"
+    ) as progress:
+        for batch_sum, batch_length in stream_fdt_batches(batches, cache_dir, n_cores):
+            sparse_matrix = add_to_running_sum(sparse_matrix, batch_sum, sparse)
+            progress.update(batch_length)
 
     sparse_matrix /= len(list_of_matfiles)
     return sparse_matrix
 
 
+def stream_fdt_batches(batches: list, cache_dir: str = None, n_cores: int = False):
+    """
+    Generator to load and sum batches of
+    fdt matrices. If n_cores is given
+    batches are loaded across a process pool
+    with at most n_cores batches in flight.
+
+    Parameters
+    ----------
+    batches: list
+        list of lists of fdt matrices
+    cache_dir: str
+        directory of converted matrix
+        cache. Default is None
+    n_cores: int
+        number of processes. Default is
+        False which loads serially
+
+    Yields
+    ------
+    tuple: tuple object
+        sparse sum of the batch and
+        number of subjects in the batch
+    """
+    n_cores = int(n_cores) if n_cores else 0
+    if n_cores <= 1:
+        for batch in batches:
+            yield sum_fdt_batch(batch, cache_dir), len(batch)
+        return
+
+    batch_iterator = iter(batches)
+    with ProcessPoolExecutor(max_workers=n_cores) as executor:
+        in_flight = {
+            executor.submit(sum_fdt_batch, batch, cache_dir): len(batch)
+            for batch in islice(batch_iterator, n_cores)
+        }
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                batch_length = in_flight.pop(future)
+                for batch in islice(batch_iterator, 1):
+                    next_future = executor.submit(sum_fdt_batch, batch, cache_dir)
+                    in_flight[next_future] = len(batch)
+                yield future.result(), batch_length
+
+
+def sum_fdt_batch(list_of_matfiles: list, cache_dir: str = None) -> sps.csr_matrix:
+    """
+    Function to load and sum a batch of
+    fdt matrices as a sparse matrix.
+
+    Parameters
+    ----------
+    list_of_matfiles: list
+        list of fdt matrices
+    cache_dir: str
+        directory of converted matrix
+        cache. Default is None
+
+    Returns
+    -------
+    batch_sum: sps.csr_matrix
+        sparse sum of the batch
+    """
+    batch_sum = load_fdt_matrix(list_of_matfiles[0], True, cache_dir)
+    for matfile in list_of_matfiles[1:]:
+        batch_sum = batch_sum + load_fdt_matrix(matfile, True, cache_dir)
+    return batch_sum
+
+
+def add_to_running_sum(
+    running_sum: np.ndarray, matrix: sps.csr_matrix, sparse: bool
+) -> np.ndarray:
+    """
+    Function to add a sparse matrix
+    to the running sum. Dense sums are
+    float64 and added to in place.
+
+    Parameters
+    ----------
+    running_sum: np.ndarray
+        running sum. None if
+        first matrix
+    matrix: sps.csr_matrix
+        matrix to add
+    sparse: bool
+        keep the running sum sparse
+
+    Returns
+    -------
+    running_sum: np.ndarray
+        updated running sum
+    """
+    if sparse:
+        return matrix if running_sum is None else running_sum + matrix
+    if running_sum is None:
+        running_sum = np.zeros(matrix.shape, dtype=np.float64)
+    matrix = matrix.tocoo()
+    running_sum[matrix.row, matrix.col] += matrix.data
+    return running_sum
+
+
+def rows_per_block(
+    matrix: np.ndarray, min_rows: int = 1, block_memory: int = 2**30
+) -> int:
+    """
+    Function to get how many rows of a
+    matrix fit into a block of memory.
+
+    Parameters
+    ----------
+    matrix: np.ndarray
+        matrix to split into row blocks
+    min_rows: int
+        minimum number of rows in a block.
+        Default is 1
+    block_memory: int
+        memory of a block in bytes
+        as float64. Default is 1GB
+
+    Returns
+    -------
+    int: integer
+        number of rows per block
+    """
+    return max(min_rows, block_memory // (matrix.shape[1] * 8))
+
+
 def demean(matrix: np.array, axis: int = 0) -> np.ndarray:
     """
     Function to demean a matrix
@@ -126,6 +480,138 @@ def demean(matrix: np.array, axis: int = 0) -> np.ndarray:
     return matrix - np.mean(matrix, axis=axis, keepdims=True)
 
 
+def centred_operator(matrix: np.ndarray) -> LinearOperator:
+    """
+    Function to wrap a matrix as a linear
+    operator with its column means removed,
+    so that it can be factorised as if it
+    was demeaned without making a demeaned copy.
+
+    Parameters
+    ----------
+    matrix: np.ndarray
+        matrix to wrap. Can be memory
+        mapped or a scipy sparse matrix
+
+    Returns
+    -------
+    LinearOperator: scipy LinearOperator
+        column centred operator of matrix
+    """
+    column_mean = np.asarray(matrix.mean(axis=0), dtype=matrix.dtype).ravel()
+
+    def matmat(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=matrix.dtype)
+        return np.asarray(matrix @ vectors) - column_mean @ vectors
+
+    def rmatmat(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=matrix.dtype)
+        return np.asarray(matrix.T @ vectors) - np.multiply.outer(
+            column_mean, vectors.sum(axis=0)
+        )
+
+    return LinearOperator(
+        matrix.shape,
+        matvec=matmat,
+        rmatvec=rmatmat,
+        matmat=matmat,
+        rmatmat=rmatmat,
+        dtype=matrix.dtype,
+    )
+
+
+def total_variance(matrix: np.ndarray) -> float:
+    """
+    Function to get the sum of squares of
+    a matrix about its column means, reading
+    dense matrices in row blocks.
+
+    Parameters
+    ----------
+    matrix: np.ndarray
+        matrix. Can be memory mapped
+        or a scipy sparse matrix
+
+    Returns
+    -------
+    float: float
+        total variance (sum of squares)
+        of the column centred matrix
+    """
+    column_mean = np.asarray(matrix.mean(axis=0), dtype=np.float64).ravel()
+    if sps.issparse(matrix):
+        sum_of_squares = matrix.multiply(matrix).sum(dtype=np.float64)
+    else:
+        block_size = rows_per_block(matrix)
+        sum_of_squares = sum(
+            np.square(matrix[start : start + block_size], dtype=np.float64).sum()
+            for start in range(0, matrix.shape[0], block_size)
+        )
+    return float(sum_of_squares - matrix.shape[0] * np.square(column_mean).sum())
+
+
+def randomized_svd(
+    matrix: np.ndarray,
+    n_components: int,
+    oversampling: int = 10,
+    power_iterations: int = 4,
+    random_state: int = 1,
+    initial_vectors: np.ndarray = None,
+) -> tuple:
+    """
+    Function to perform a randomized truncated
+    SVD (Halko et al. 2011). Only uses matrix
+    products so works on linear operators.
+
+    Parameters
+    ----------
+    matrix: np.ndarray
+        matrix or LinearOperator to
+        factorise
+    n_components: int
+        number of singular vectors to keep
+    oversampling: int
+        number of extra random vectors
+        to sample the range with. Default is 10
+    power_iterations: int
+        number of power iterations to
+        sharpen the range with. Default is 4
+    random_state: int
+        seed of random vectors. Default is 1
+    initial_vectors: np.ndarray
+        vectors spanning a guess of the right
+        singular subspace (columns) to warm start
+        from. Random vectors are only used
+        for the oversampling. Default is None
+
+    Returns
+    -------
+    tuple: tuple
+        left singular vectors, singular values
+        and right singular vectors in descending
+        order of singular values
+    """
+    n_random = min(n_components + oversampling, min(matrix.shape))
+    random_vectors = np.random.default_rng(random_state).standard_normal(
+        (matrix.shape[1], n_random)
+    )
+    if initial_vectors is not None:
+        n_initial = min(initial_vectors.shape[1], n_random)
+        random_vectors[:, :n_initial] = initial_vectors[:, :n_initial]
+    range_basis, _ = np.linalg.qr(matrix @ random_vectors.astype(matrix.dtype))
+    for _ in range(power_iterations):
+        range_basis, _ = np.linalg.qr(matrix.T @ range_basis)
+        range_basis, _ = np.linalg.qr(matrix @ range_basis)
+    left, singular_values, right = np.linalg.svd(
+        (matrix.T @ range_basis).T, full_matrices=False
+    )
+    return (
+        (range_basis @ left)[:, :n_components],
+        singular_values[:n_components],
+        right[:n_components],
+    )
+
+
 def melodic_incremental_group_pca(
     fdt_matrix: np.array, n_dim: int = 1000, d_pca: int = 1000, keep_mean: bool = False
 ) -> np.ndarray:
@@ -159,7 +645,7 @@ def melodic_incremental_group_pca(
     nprint(f"{col['purple']}\nPerforming PCA (MIGP){col['reset']}")
     nprint("WARNING THIS CAN TAKE A VERY LONG TIME")
     if keep_mean:
-        matrix_mean = np.mean(fdt_matrix, axis=1, keepdims=True)
+        matrix_mean = np.asarray(fdt_matrix.mean(axis=1)).reshape(-1, 1)
 
     if d_pca > n_dim:
         d_pca = n_dim
@@ -179,6 +665,7 @@ def matrix_migp(
     fdt_matrix: np.ndarray,
     n_dim: int = 1000,
     d_pca: int = 1000,
+    power_iterations: int = 1,
 ) -> np.ndarray:
     """
     Function to apply
@@ -197,37 +684,163 @@ def matrix_migp(
     d_pca: int
         maximum number of prinicple components kept
         (set to n_dim if larger than n_dim) Default is 1000.
+    power_iterations: int
+        number of power iterations of each
+        update. Default is 1
+
+
+    Returns
+    -------
+    pca_matrix: np.array
+        matrix that has been reduced.
+    """
+    n_blocks = -(-fdt_matrix.shape[1] // n_dim)
+    return incremental_migp(
+        tqdm(column_blocks(fdt_matrix, n_dim), total=n_blocks, colour="magenta"),
+        n_dim,
+        d_pca,
+        power_iterations,
+    )
+
+
+def subject_migp(
+    list_of_matfiles: list,
+    n_dim: int = 1000,
+    d_pca: int = 1000,
+    cache_dir: str = None,
+    power_iterations: int = 1,
+) -> np.ndarray:
+    """
+    Function to apply MELODIC's Incremental
+    Group-PCA dimensionality across subjects.
+    Subjects are loaded one at a time in a random
+    order and streamed into the PCA, so the group
+    matrix is never held in memory.
 
+    Parameters
+    ----------
+    list_of_matfiles: list
+        list of paths to subjects'
+        fdt_matrix2.dot
+    n_dim: int
+        number of columns of each block
+        streamed into the PCA. Default is 1000.
+    d_pca: int
+        maximum number of prinicple components kept
+        (set to n_dim if larger than n_dim) Default is 1000.
+    cache_dir: str
+        directory of converted matrix
+        cache. Default is None
+    power_iterations: int
+        number of power iterations of each
+        update. Default is 1
 
     Returns
     -------
     pca_matrix: np.array
         matrix that has been reduced.
     """
+    migp_timer = Timer()
+    migp_timer.tic()
+    col = colours()
+    nprint(f"{col['purple']}\nPerforming subject wise PCA (MIGP){col['reset']}")
+    if d_pca > n_dim:
+        d_pca = n_dim
+
+    def subject_blocks():
+        for subject in tqdm(
+            np.random.permutation(list_of_matfiles), colour="magenta", unit="Subjects"
+        ):
+            yield from column_blocks(load_fdt_matrix(subject, True, cache_dir), n_dim)
+
+    pca_matrix = incremental_migp(subject_blocks(), n_dim, d_pca, power_iterations)
+    nprint(f"New matrix size now {pca_matrix.shape[0]}x{pca_matrix.shape[1]}")
+    nprint(f"MIGP finished in {migp_timer.toc()} secs.\n")
+    return pca_matrix
+
+
+def column_blocks(fdt_matrix: np.ndarray, n_dim: int):
+    """
+    Generator of the column blocks of a
+    matrix in a random order. Only the columns
+    of each block are copied.
+
+    Parameters
+    ----------
+    fdt_matrix: np.ndarray
+        matrix. Can be a scipy
+        sparse matrix
+    n_dim: int
+        number of columns in a block
 
+    Yields
+    ------
+    block: np.ndarray
+        dense block of columns
+    """
+    if sps.issparse(fdt_matrix):
+        # Column slicing a csc matrix only touches the selected columns
+        fdt_matrix = fdt_matrix.tocsc()
     random_idx = np.random.permutation(fdt_matrix.shape[1])
-    shuffled_column = fdt_matrix[:, random_idx]
-    intermediary_matrix = None
+    for matrix_index in range(0, fdt_matrix.shape[1], n_dim):
+        block = fdt_matrix[:, np.sort(random_idx[matrix_index : matrix_index + n_dim])]
+        yield block.toarray() if sps.issparse(block) else block
 
-    for matrix_index in tqdm(range(0, fdt_matrix.shape[1], n_dim), colour="magenta"):
-        pca_matrix = shuffled_column[
-            :, matrix_index : min(matrix_index + n_dim, fdt_matrix.shape[1] + 1)
-        ].T
 
-        if intermediary_matrix is not None:
-            intermediary_matrix = np.concatenate(
-                (intermediary_matrix, demean(pca_matrix)), axis=0
-            )
-        else:
-            intermediary_matrix = demean(pca_matrix)
+def incremental_migp(
+    blocks, n_dim: int = 1000, d_pca: int = 1000, power_iterations: int = 1
+) -> np.ndarray:
+    """
+    Function to do the MIGP updates
+    over a stream of column blocks.
 
-        k_to_compute = min(d_pca, n_dim)
-        _, k_eignvectors = eigsh(
-            intermediary_matrix @ intermediary_matrix.T, k_to_compute
-        )
+    Each block is written into a preallocated
+    working matrix below the currently kept
+    components. Each update is a randomized SVD
+    warm started from the previous block's subspace.
 
-        intermediary_matrix = k_eignvectors.T @ intermediary_matrix
+    Parameters
+    ----------
+    blocks: iterable
+        column blocks, each with at
+        most n_dim columns
+    n_dim: int
+        maximum number of columns
+        in a block. Default is 1000.
+    d_pca: int
+        maximum number of prinicple components kept
+        (set to n_dim if larger than n_dim) Default is 1000.
+    power_iterations: int
+        number of power iterations of each
+        update. Default is 1
 
-    pca_matrix = intermediary_matrix[: min(intermediary_matrix.shape[0], d_pca), :].T
+    Returns
+    -------
+    pca_matrix: np.array
+        matrix that has been reduced.
+    """
+    k_to_compute = min(d_pca, n_dim)
+    working_matrix = None
+    n_kept = 0
+    right_vectors = None
+
+    for block in blocks:
+        if working_matrix is None:
+            working_matrix = np.empty(
+                (k_to_compute + n_dim, block.shape[0]),
+                dtype=np.result_type(block.dtype, np.float32),
+            )
+        n_filled = n_kept + block.shape[1]
+        working_matrix[n_kept:n_filled] = block.T
+        working_matrix[n_kept:n_filled] -= working_matrix[n_kept:n_filled].mean(axis=0)
+
+        _, singular_values, right_vectors = randomized_svd(
+            working_matrix[:n_filled],
+            min(k_to_compute, n_filled),
+            power_iterations=power_iterations,
+            initial_vectors=None if right_vectors is None else right_vectors.T,
+        )
+        n_kept = len(singular_values)
+        working_matrix[:n_kept] = singular_values[:, np.newaxis] * right_vectors
 
-    return pca_matrix
+    return working_matrix[: min(n_kept, d_pca)].T.copy()
@@ -76,15 +76,74 @@ def check_pca(pca_type):
        returns lower case
        of str
     """
-    pca_types = ["pca", "migp"]
+    pca_types = [
+        "pca",
+        "incremental",
+        "migp",
+        "randomized",
+        "truncated",
+        "arpack",
+        "lobpcg",
+    ]
     if pca_type.lower() not in pca_types:
         error_and_exit(
             False,
-            f"{pca_type} is not implemented in NFACT. NFACT currently implements PCA and MIGP (case insensitive). Please specify with --pca_type",
+            f"{pca_type} is not implemented in NFACT. NFACT currently implements PCA, incremental, MIGP, randomized, truncated, arpack and lobpcg (case insensitive). Please specify with --pca_type",
         )
     return pca_type.lower()
 
 
+def process_svd_option(value: str, option: str) -> int:
+    """
+    Function to process an integer
+    option, such as those of the
+    randomized PCA types, from
+    command line input.
+
+    Parameters
+    ----------
+    value: str
+        value of option
+    option: str
+        name of option
+
+    Returns
+    -------
+    value: int
+        option as int
+    """
+    try:
+        value = int(value)
+    except Exception:
+        error_and_exit(
+            False,
+            f"{option} must be a interger value. {value} is not a interger type",
+        )
+    return value
+
+
+def process_sweep(dim: int, sweep: list) -> list:
+    """
+    Function to process the sweep
+    dimensions from command line input.
+
+    Parameters
+    ----------
+    dim: int
+        number of dimensions
+    sweep: list
+        list of extra dimensions
+
+    Returns
+    -------
+    list: list object
+        sorted list of unique dimensions
+        including dim
+    """
+    sweep = sweep if sweep else []
+    return sorted({dim, *[process_dim(sweep_dim) for sweep_dim in sweep]})
+
+
 def process_command_args(args: dict) -> dict:
     """
     Function to process command line arguments.
@@ -100,11 +159,29 @@ def process_command_args(args: dict) -> dict:
     args: dict
     """
     args["dim"] = process_dim(args["dim"])
+    args["sweep"] = process_sweep(args["dim"], args["sweep"])
+    args["subjects_per_worker"] = process_svd_option(
+        args["subjects_per_worker"], "subjects_per_worker"
+    )
+    error_and_exit(
+        args["subjects_per_worker"] > 0, "subjects_per_worker must be at least 1"
+    )
     if args["wta_zthr"]:
         args["wta_zthr"] = process_wta_zhr(args["wta_zthr"])
     if args["algo"] == "nmf":
+        if args["subject_migp"]:
+            error_and_exit(
+                False,
+                "--subject_migp is only implemented for ICA. NMF needs the group average matrix",
+            )
         return args
+    if args["warm_start"]:
+        error_and_exit(False, "--warm_start is only implemented for NMF")
     args["components"] = process_components(args["components"], args["algo"])
     args["pca_type"] = check_pca(args["pca_type"])
+    args["oversampling"] = process_svd_option(args["oversampling"], "oversampling")
+    args["power_iterations"] = process_svd_option(
+        args["power_iterations"], "power_iterations"
+    )
 
     return args
@@ -1,6 +1,12 @@
 import argparse
 from NFACT.base.utils import colours, no_args, verbose_help_message
-from NFACT.base.base_args import set_up_args, base_arguments, seed_roi_args, algo_arg
+from NFACT.base.base_args import (
+    set_up_args,
+    base_arguments,
+    seed_roi_args,
+    algo_arg,
+    cache_args,
+)
 
 
 def nfact_decomp_args() -> dict:
@@ -55,6 +61,50 @@ def nfact_decomp_args() -> dict:
         """,
     )
     algo_arg(decomp_args)
+    decomp_args.add_argument(
+        "-sp",
+        "--sparse",
+        dest="sparse",
+        action="store_true",
+        default=False,
+        help="""
+        Keep the fdt_matrix2 as a sparse matrix
+        through loading, averaging and decomposition.
+        Memory then scales with the number of streamlines
+        rather than seeds x targets. Group average
+        is saved as average_matrix2.npz
+        """,
+    )
+    decomp_args.add_argument(
+        "-sw",
+        "--sweep",
+        dest="sweep",
+        nargs="+",
+        default=False,
+        help="""
+        Extra dimensions to decompose at alongside --dim.
+        Include a space between dimensions. The matrix is
+        loaded once and for ICA the PCA is done once and
+        shared by every dimension. Each dimension is saved
+        with its own dim in the file names. Pass --dim to
+        nfact_dr to pick which dimension to dual regress.
+        """,
+    )
+    decomp_args.add_argument(
+        "-ws",
+        "--warm_start",
+        dest="warm_start",
+        action="store_true",
+        default=False,
+        help="""
+        Start NMF from the components of a previous run
+        at the same or closest dimension instead of from
+        scratch. Components of every NMF are saved in
+        group_averages for this. In a --sweep without
+        --n_cores each dimension also starts from the one
+        below it. Only implemented for NMF.
+        """,
+    )
 
     output_args = base_args.add_argument_group(
         f"{col['darker_pink']}Output options{col['reset']}"
@@ -87,6 +137,35 @@ def nfact_decomp_args() -> dict:
         and saves map. This is useful for visualization
         """,
     )
+    cache_args(base_args, col)
+    decomp_args.add_argument(
+        "-nc",
+        "--n_cores",
+        dest="n_cores",
+        default=False,
+        type=int,
+        help="""
+        Number of processes to load and average
+        subjects' fdt_matrix2 with and to decompose
+        --sweep dimensions across. Default is to load
+        subjects and decompose one after another.
+        Sparse matrices are always decomposed one
+        dimension at a time.
+        """,
+    )
+    decomp_args.add_argument(
+        "-spw",
+        "--subjects_per_worker",
+        dest="subjects_per_worker",
+        default="1",
+        help="""
+        Number of subjects each --n_cores process
+        loads and sums before returning its partial
+        sum. Larger values send fewer matrices back
+        to be added but use more memory per process.
+        Default is 1
+        """,
+    )
     ica_options = base_args.add_argument_group(
         f"{col['purple']}ICA options{col['reset']}"
     )
@@ -108,14 +187,60 @@ def nfact_decomp_args() -> dict:
         default="pca",
         help="""
         Which type of PCA to do before ICA. 
-        Options are 'pca' which is sckit learns default PCA
-        or 'migp' (MELODIC's Incremental Group-PCA dimensionality).
+        Options are 'pca' which is sckit learns default PCA,
+        'incremental' (scikit learns IncrementalPCA over row blocks
+        so the matrix is never fully loaded. Approximates 'pca'),
+        'migp' (MELODIC's Incremental Group-PCA dimensionality),
+        'randomized' (randomized SVD), 'truncated' (scikit learns
+        TruncatedSVD, no centring so suited to sparse matrices),
+        'arpack' or 'lobpcg' (scipy iterative SVD solvers).
+        Only the retained components are computed by
+        'randomized', 'truncated', 'arpack' and 'lobpcg',
+        which is much faster for large matrices.
         Default is 'pca' as for most
         cases 'migp' is slow and not needed.
         Option is case insensitive.
         """,
     )
+    ica_options.add_argument(
+        "-ov",
+        "--oversampling",
+        dest="oversampling",
+        default="10",
+        help="""
+        Number of extra random vectors used by the
+        'randomized' and 'truncated' PCA types.
+        Default is 10
+        """,
+    )
+    ica_options.add_argument(
+        "-pi",
+        "--power_iterations",
+        dest="power_iterations",
+        default="4",
+        help="""
+        Number of power iterations used by the
+        'randomized' and 'truncated' PCA types.
+        More iterations are slower but more accurate.
+        Default is 4
+        """,
+    )
 
+    ica_options.add_argument(
+        "-sm",
+        "--subject_migp",
+        dest="subject_migp",
+        action="store_true",
+        default=False,
+        help="""
+        Streams each subject's fdt_matrix2 into MIGP
+        one subject at a time instead of averaging
+        subjects first, so the group average matrix is never 
+        held in memory. Use for large cohorts. Subjects are 
+        loaded twice (PCA and white matter components) so
+        consider using with --cache_dir. Ignores --pca_type.
+        """,
+    )
     ica_options.add_argument(
         "-S",
         "--sign_flip",
@@ -3,7 +3,11 @@ from NFACT.dual_reg.nfact_dr_set_up import (
     check_nfact_decomp_directory,
     create_nfact_dr_folder_set_up,
 )
-from NFACT.dual_reg.nfact_dr_functions import get_paths
+from NFACT.dual_reg.nfact_dr_functions import (
+    get_paths,
+    completed_subjects,
+    component_dim,
+)
 from NFACT.dual_reg.local.local_run import run_locally
 from NFACT.dual_reg.cluster.cluster_run import run_on_cluster
 from NFACT.base.setup import (
@@ -16,8 +20,9 @@ from NFACT.base.setup import (
     check_rois,
 )
 from NFACT.base.filesystem import delete_folder
+from NFACT.base.matrix_handling import evict_matrix_cache
 from NFACT.base.cluster_support import processing_cluster
-from NFACT.base.utils import colours, nprint
+from NFACT.base.utils import colours, nprint, error_and_exit
 from NFACT.base.logging import NFACT_logs
 from NFACT.base.setup import check_fsl_is_installed
 from NFACT.base.signithandler import Signit_handler
@@ -51,6 +56,17 @@ def nfact_dr_main(args: dict = None) -> None:
     # Do argument checking
     check_arguments(args, ["seeds", "list_of_subjects", "algo"])
     args["algo"] = check_algo(args["algo"])
+    try:
+        args["nnls_tol"] = float(args["nnls_tol"])
+    except ValueError:
+        error_and_exit(False, f"nnls_tol must be a number. {args['nnls_tol']} is not")
+    if args["memory_budget"]:
+        try:
+            args["memory_budget"] = float(args["memory_budget"])
+        except ValueError:
+            error_and_exit(
+                False, f"memory_budget must be a number. {args['memory_budget']} is not"
+            )
 
     # Get component paths
     paths = get_paths(args)
@@ -61,6 +77,7 @@ def nfact_dr_main(args: dict = None) -> None:
     args = get_subjects(args)
     check_subject_exist(args["ptxdir"])
     check_nfact_decomp_directory(paths["component_path"], paths["group_average_path"])
+    paths["dim"] = component_dim(paths["component_path"], args["dim"])
 
     if args["cluster"]:
         check_fsl_is_installed()
@@ -69,6 +86,16 @@ def nfact_dr_main(args: dict = None) -> None:
         # Needed for high res data. Takes a long time
         if args["cluster_time"] == "600":
             args["cluster_time"] = "4320"
+        try:
+            args["subjects_per_job"] = int(args["subjects_per_job"])
+        except ValueError:
+            error_and_exit(
+                False,
+                f"subjects_per_job must be a whole number. {args['subjects_per_job']} is not",
+            )
+        error_and_exit(
+            args["subjects_per_job"] > 0, "subjects_per_job must be at least 1"
+        )
 
     # Set up directory
     create_nfact_dr_folder_set_up(args["outdir"])
@@ -93,11 +120,21 @@ def nfact_dr_main(args: dict = None) -> None:
     nprint("\nDual Regression\n")
     nprint("-" * 100)
 
-    if args["cluster"]:
+    args["skip"] = completed_subjects(args, paths) if args["incremental"] else []
+    if args["skip"]:
+        nprint(
+            f"{col['plum']}Skipping up to date subjects:{col['reset']} {len(args['skip'])}"
+        )
+    if len(args["skip"]) == len(args["ptxdir"]):
+        nprint(f"{col['darker_pink']}All subjects are up to date{col['reset']}")
+    elif args["cluster"]:
         run_on_cluster(args, paths)
     else:
         run_locally(args, paths)
 
+    if args["cache_dir"]:
+        evict_matrix_cache(args["cache_dir"], args["cache_size"])
+
     nprint(f"{col['darker_pink']}NFACT_DR has finished{col['reset']}")
     log.clear_logging()
 
@@ -1,6 +1,15 @@
-from NFACT.dual_reg.nfact_dr_functions import get_subject_id
-from NFACT.base.utils import nprint, colours
-from NFACT.base.cluster_support import cluster_submission, Queue_Monitoring
+from NFACT.dual_reg.nfact_dr_functions import (
+    get_subject_id,
+    get_group_level_components,
+)
+from NFACT.dual_reg.dual_regression import save_dr_model
+from NFACT.base.utils import nprint, colours, error_and_exit
+from NFACT.base.cluster_support import (
+    cluster_submission,
+    cluster_array_submission,
+    sentinel_path,
+    Queue_Monitoring,
+)
 from pathlib import Path
 import os
 import sys
@@ -46,15 +55,19 @@ def get_cluster_script_path() -> str:
 
 
 def build_cluster_command(
-    fdt_path: str,
+    fdt_path: list,
     output_dir: str,
     component_path: str,
     group_average_path: str,
     algo: str,
     seeds: str,
-    sub_id: str,
+    sub_id: list,
     roi: str,
     parallel: str,
+    cache_dir: str = None,
+    nnls_tol: float = 0,
+    dr_model: str = None,
+    dim: int = None,
 ) -> list:
     """
     Function to build out cluster
@@ -62,17 +75,24 @@ def build_cluster_command(
 
     Parameters
     ----------
-    fdt_path: str
-        path to subjects fdt_path
-
+    fdt_path: list
+        paths to subjects fdt_path
+        to run in the job
     output_dir: str,
     component_path: str,
     group_average_path: str,
     algo: str,
     seeds: str,
-    sub_id: str,
+    sub_id: list
+        subject ids matching fdt_path
     roi: str,
     parallel: str
+    cache_dir: str = None
+    nnls_tol: float = 0
+    dr_model: str = None
+        path to saved dual regression model
+    dim: int = None
+        dimension of the components
 
     Returns
     -------
@@ -85,7 +105,7 @@ def build_cluster_command(
         python_path,
         cluster_script,
         "--fdt_path",
-        str(fdt_path),
+        *[str(path) for path in fdt_path],
         "--output_dir",
         str(output_dir),
         "--component_path",
@@ -97,20 +117,115 @@ def build_cluster_command(
         "--seeds",
         *seeds,
         "--id",
-        str(sub_id),
+        *[str(subject) for subject in sub_id],
         "--roi",
         *roi,
     ]
     if parallel:
         command.extend(["--parallel", str(parallel)])
+    if cache_dir:
+        command.extend(["--cache_dir", str(cache_dir)])
+    command.extend(["--nnls_tol", str(nnls_tol)])
+    if dr_model:
+        command.extend(["--dr_model", str(dr_model)])
+    if dim:
+        command.extend(["--dim", str(dim)])
     return command
 
 
-def submit_to_cluster(args: dict, paths: dict) -> list:
+def save_group_components(args: dict, paths: dict) -> str:
+    """
+    Function to decode the group
+    components once and save them as
+    a dual regression model that every
+    cluster job memory maps.
+
+    Parameters
+    ----------
+    args: dict
+        cmd arguments
+    paths: dict
+        dictionary of paths
+
+    Returns
+    -------
+    model_path: str
+        path to saved model
+    """
+    try:
+        components = get_group_level_components(
+            paths["component_path"],
+            paths["group_average_path"],
+            args["seeds"],
+            args["roi"],
+            paths["dim"],
+        )
+    except Exception:
+        error_and_exit(False, "Unable to find components")
+    model_path = os.path.join(args["outdir"], "nfact_dr", "dr_model.pkl")
+    save_dr_model(components, model_path)
+    return model_path
+
+
+def subject_batches(args: dict) -> list:
+    """
+    Function to split subjects into
+    batches of subjects_per_job.
+    Subjects in args["skip"] are left out.
+
+    Parameters
+    ----------
+    args: dict
+        cmd arguments
+
+    Returns
+    -------
+    list: list object
+        list of batches, each a dict
+        of fdt paths and subject ids
+    """
+    subjects = [
+        (sub, get_subject_id(sub, idx))
+        for idx, sub in enumerate(args["ptxdir"])
+        if sub not in args.get("skip", [])
+    ]
+    per_job = args["subjects_per_job"]
+    return [
+        {
+            "fdt_path": [sub for sub, _ in subjects[start : start + per_job]],
+            "sub_id": [sub_id for _, sub_id in subjects[start : start + per_job]],
+        }
+        for start in range(0, len(subjects), per_job)
+    ]
+
+
+def job_name(sub_ids: list) -> str:
+    """
+    Function to name a job after
+    the subjects it runs.
+
+    Parameters
+    ----------
+    sub_ids: list
+        list of subject ids
+
+    Returns
+    -------
+    str: string
+        name of job
+    """
+    if len(sub_ids) == 1:
+        return f"{sub_ids[0]}_nfact_dr"
+    return f"{sub_ids[0]}_to_{sub_ids[-1]}_nfact_dr"
+
+
+def submit_to_cluster(args: dict, paths: dict, dr_model: str = None) -> dict:
     """
     Function to submit jobs to cluster
-    using fsl_sub
-    Function to run jobs on cluster
+    using fsl_sub. Each job runs
+    subjects_per_job subjects. Jobs
+    are either submitted separately or
+    together as one array job.
 
     Parameters
     ----------
@@ -118,39 +233,72 @@ def submit_to_cluster(args: dict, paths: dict) -> list:
         cmd arguments
     paths: dict
         dictionary of paths
+    dr_model: str = None
+        path to saved dual regression model
 
     Returns
     -------
-    job_ids: list
-        list of job ids
+    jobs: dict
+        dictionary of job id to the
+        sentinel file(s) the job writes
     """
-    job_ids = []
-    for idx, sub in enumerate(args["ptxdir"]):
-        sub_id = get_subject_id(sub, idx)
-        nprint(f"Submittng {sub_id}")
+    log_dir = os.path.join(args["outdir"], "nfact_dr", "logs")
+    batches = subject_batches(args)
+    # Wall time is per subject, so a job running several needs longer
+    cluster_time = str(int(args["cluster_time"]) * args["subjects_per_job"])
+    commands = []
+    jobs = {}
+    for batch in batches:
+        nprint(f"Submittng {' '.join(batch['sub_id'])}")
         cluster_command = build_cluster_command(
-            sub,
+            batch["fdt_path"],
             os.path.join(args["outdir"], "nfact_dr"),
             paths["component_path"],
             paths["group_average_path"],
             args["algo"],
             args["seeds"],
-            sub_id,
+            batch["sub_id"],
             args["roi"],
             args["n_cores"],
+            args["cache_dir"],
+            args["nnls_tol"],
+            dr_model,
+            paths["dim"],
         )
+        if args["array_job"]:
+            commands.append(cluster_command)
+            continue
+        sentinel = sentinel_path(log_dir, job_name(batch["sub_id"]))
         id = cluster_submission(
             cluster_command,
-            args["cluster_time"],
+            cluster_time,
+            args["cluster_ram"],
+            args["cluster_queue"],
+            job_name(batch["sub_id"]),
+            log_dir,
+            args["cluster_qos"],
+            False,
+            sentinel,
+        )
+        jobs[id] = sentinel
+    if args["array_job"]:
+        sentinels = [
+            sentinel_path(log_dir, job_name(batch["sub_id"])) for batch in batches
+        ]
+        id = cluster_array_submission(
+            commands,
+            os.path.join(log_dir, "nfact_dr_tasks.txt"),
+            cluster_time,
             args["cluster_ram"],
             args["cluster_queue"],
-            f"{sub_id}_nfact_dr",
-            os.path.join(args["outdir"], "nfact_dr", "logs"),
+            "nfact_dr",
+            log_dir,
             args["cluster_qos"],
             False,
+            sentinels,
         )
-        job_ids.append(id)
-    return job_ids
+        jobs[id] = sentinels
+    return jobs
 
 
 def run_on_cluster(args: dict, paths: dict) -> None:
@@ -171,7 +319,9 @@ def run_on_cluster(args: dict, paths: dict) -> None:
 
     col = colours()
     nprint(f"{col['pink']}Running{col['reset']}: Cluster")
+    nprint(f"{col['pink']}Obtaining:{col['reset']} Components")
+    dr_model = save_group_components(args, paths)
     nprint(f"{col['pink']}Submtting to{col['reset']}: {args['cluster_queue']}")
-    ids = submit_to_cluster(args, paths)
+    jobs = submit_to_cluster(args, paths, dr_model)
     queue = Queue_Monitoring()
-    queue.monitor(ids)
+    queue.monitor(list(jobs), jobs)
@@ -4,9 +4,11 @@ from NFACT.dual_reg.dual_regression import (
     nmf_dual_regression,
     ica_dual_regression,
     run_decomp,
+    load_dr_model,
 )
 from NFACT.dual_reg.nfact_dr_functions import save_dual_regression_images
 from NFACT.base.utils import colours
+from functools import partial
 import argparse
 import os
 
@@ -26,7 +28,10 @@ def script_args() -> dict:
     """
     parser = argparse.ArgumentParser(description="Run Dual Regression")
     parser.add_argument(
-        "--fdt_path", required=True, help="Directory to individual subject fdt path"
+        "--fdt_path",
+        required=True,
+        nargs="+",
+        help="Directory to individual subject fdt path(s).",
     )
     parser.add_argument(
         "--output_dir", required=True, help="Directory to save the output components."
@@ -39,11 +44,25 @@ def script_args() -> dict:
     )
     parser.add_argument("--algo", required=True, help="Which algo has been run")
     parser.add_argument("--seeds", required=True, nargs="+", help="Path to seed(s).")
-    parser.add_argument("--id", required=True, help="Subject ID.")
+    parser.add_argument("--id", required=True, nargs="+", help="Subject ID(s).")
     parser.add_argument("--roi", nargs="+", default=False, help="Path to roi(s).")
     parser.add_argument(
         "--parallel", default=1, type=int, help="Number of cores to parallel with"
     )
+    parser.add_argument(
+        "--cache_dir", default=None, help="Directory of converted matrix cache."
+    )
+    parser.add_argument(
+        "--nnls_tol", default=0, type=float, help="Tolerance of batched nnls."
+    )
+    parser.add_argument(
+        "--dr_model",
+        default=None,
+        help="Path to a saved dual regression model of the group components.",
+    )
+    parser.add_argument(
+        "--dim", default=None, type=int, help="Dimension of the components."
+    )
     return vars(parser.parse_args())
 
 
@@ -51,6 +70,10 @@ def main_dr(args: dict) -> None:
     """
     Main cluster function.
 
+    Group components are loaded once
+    and every subject given to the
+    job is regressed in turn.
+
     Parameters
     ----------
     args: dict
@@ -73,18 +96,78 @@ def main_dr(args: dict) -> None:
         print(
             f"{col['pink']}Obtaining{col['reset']}: Group Level Components", flush=True
         )
-        components = get_group_level_components(
-            args["component_path"],
-            args["group_average_path"],
-            args["seeds"],
-            args["roi"],
+        components = (
+            load_dr_model(args["dr_model"])
+            if args.get("dr_model")
+            else get_group_level_components(
+                args["component_path"],
+                args["group_average_path"],
+                args["seeds"],
+                args["roi"],
+                args["dim"],
+            )
+        )
+    except Exception as e:
+        print(
+            f"{col['red']}Dual regression failed due to: {e} {col['reset']}", flush=True
+        )
+        exit(1)
+
+    dr_regression = (
+        partial(nmf_dual_regression, tol=args["nnls_tol"])
+        if args["algo"].lower() == "nmf"
+        else ica_dual_regression
+    )
+    failed = [
+        sub_id
+        for fdt_path, sub_id in zip(args["fdt_path"], args["id"])
+        if not subject_dr(args, components, dr_regression, fdt_path, sub_id)
+    ]
+    if failed:
+        print(
+            f"{col['red']}Dual regression failed for: {' '.join(failed)} {col['reset']}",
+            flush=True,
         )
+        exit(1)
+    return None
+
 
-        print(f"{col['pink']}Obtaining{col['reset']}: FDT Matrix")
-        matrix = load_fdt_matrix(os.path.join(args["fdt_path"], "fdt_matrix2.dot"))
-        dr_regression = nmf_dual_regression if args["algo"] else ica_dual_regression
+def subject_dr(
+    args: dict, components: dict, dr_regression: object, fdt_path: str, sub_id: str
+) -> bool:
+    """
+    Function to run dual regression
+    on a single subject.
+
+    Parameters
+    ----------
+    args: dict
+        dictionary of args
+    components: dict
+        group components
+    dr_regression: object
+        dual regression function
+    fdt_path: str
+        path to subjects fdt_path
+    sub_id: str
+        subjects ID
+
+    Returns
+    -------
+    bool: boolean
+        True if dual regression
+        completed
+    """
+    col = colours()
+    try:
+        print(f"{col['pink']}Obtaining{col['reset']}: FDT Matrix for {sub_id}")
+        matrix = load_fdt_matrix(
+            os.path.join(fdt_path, "fdt_matrix2.dot"),
+            cache_dir=args["cache_dir"],
+        )
         print(f"{col['pink']}Running{col['reset']}: Dual Regression", flush=True)
         dr_results = run_decomp(dr_regression, components, matrix, args["parallel"])
+        del matrix
         print(f"{col['pink']}Saving{col['reset']}: Components", flush=True)
         save_dual_regression_images(
             dr_results,
@@ -92,17 +175,19 @@ def main_dr(args: dict) -> None:
             args["seeds"],
             args["algo"].upper(),
             dr_results["white_components"].shape[0],
-            args["id"],
-            args["fdt_path"],
+            sub_id,
+            fdt_path,
             args["roi"],
         )
-        print(f"{col['pink']}Completed{col['reset']}: {args['id']}", flush=True)
-    except Exception as e:
+        print(f"{col['pink']}Completed{col['reset']}: {sub_id}", flush=True)
+    # run_decomp exits on failure, which would skip the rest of the batch
+    except (Exception, SystemExit) as e:
         print(
-            f"{col['red']}Dual regression failed due to: {e} {col['reset']}", flush=True
+            f"{col['red']}Dual regression failed for {sub_id} due to: {e} {col['reset']}",
+            flush=True,
         )
-        exit(1)
-    return None
+        return False
+    return True
 
 
 if __name__ == "__main__":
@@ -1,8 +1,12 @@
 from NFACT.base.utils import error_and_exit, nprint, colours, Timer
 import numpy as np
 from scipy.optimize import nnls
-from joblib import Parallel, delayed
+from scipy.linalg import cho_factor, cho_solve
+from joblib import Parallel, delayed, dump, load
+from sklearn.utils import gen_batches
 from tqdm import tqdm
+import tempfile
+import os
 
 
 def run_decomp(
@@ -72,15 +76,29 @@ def ica_dual_regression(
     if parallel:
         print("ICA cannot be run in parallel")
 
-    wm_component_grey_map = (
-        np.linalg.pinv(components["white_components"].T) @ connectivity_matrix.T
+    # Only the k x k normal equations are solved. The connectivity matrix is
+    # read three times, with both regressions onto it sharing one product.
+    dtype = connectivity_matrix.dtype
+    white_components = components["white_components"]
+    grey_components = components["grey_components"]
+    white_gram = components.get("white_gram") or gram_factor(white_components.T)
+    grey_gram = components.get("grey_gram") or gram_factor(grey_components)
+    wm_component_grey_map = solve_gram(
+        white_gram,
+        (connectivity_matrix @ white_components.T.astype(dtype)).T,
     ).T
-    wm_component_white_map = np.linalg.pinv(wm_component_grey_map) @ connectivity_matrix
-    gm_component_grey = (
-        np.linalg.pinv(components["grey_components"]) @ connectivity_matrix
+    regressors = np.vstack((wm_component_grey_map.T, grey_components.T))
+    regression = regressors.astype(dtype) @ connectivity_matrix
+    n_white = wm_component_grey_map.shape[1]
+    wm_component_white_map = solve_gram(
+        factorise_gram(wm_component_grey_map.T @ wm_component_grey_map),
+        regression[:n_white],
     )
-    gm_component_grey_map = (
-        np.linalg.pinv(gm_component_grey.T) @ connectivity_matrix.T
+    gm_component_grey = solve_gram(grey_gram, regression[n_white:])
+    del regression
+    gm_component_grey_map = solve_gram(
+        factorise_gram(gm_component_grey @ gm_component_grey.T),
+        (connectivity_matrix @ gm_component_grey.T.astype(dtype)).T,
     ).T
 
     return {
@@ -89,8 +107,153 @@ def ica_dual_regression(
     }
 
 
+def dr_model(components: dict) -> dict:
+    """
+    Function to build a dual regression
+    model from the group components.
+
+    The Gram matrices of the group components
+    and their factorisations only depend on the
+    group, so they are computed once here and
+    re-used for every subject.
+
+    Parameters
+    ----------
+    components: dict
+        dictionary of group grey_components
+        and white_components
+
+    Returns
+    -------
+    dict: dictionary
+        components with the factorised
+        Gram matrices of the white
+        (white_gram) and grey (grey_gram)
+        components
+    """
+    return {
+        **components,
+        "white_gram": gram_factor(components["white_components"].T),
+        "grey_gram": gram_factor(components["grey_components"]),
+    }
+
+
+def save_dr_model(model: dict, file_name: str) -> None:
+    """
+    Function to save a dual
+    regression model.
+
+    Parameters
+    ----------
+    model: dict
+        output of dr_model
+    file_name: str
+        path to save model to
+
+    Returns
+    -------
+    None
+    """
+    dump(model, file_name)
+
+
+def load_dr_model(file_name: str, mmap_mode: str = "r") -> dict:
+    """
+    Function to load a saved
+    dual regression model.
+
+    Parameters
+    ----------
+    file_name: str
+        path to saved model
+    mmap_mode: str
+        mode to memory map the
+        component arrays with so
+        concurrent jobs share them
+        from the page cache. None
+        reads them into memory.
+        Default is r
+
+    Returns
+    -------
+    dict: dictionary
+        dual regression model
+    """
+    return load(file_name, mmap_mode=mmap_mode)
+
+
+def gram_factor(design: np.ndarray) -> dict:
+    """
+    Function to compute and factorise
+    the Gram matrix of a design.
+
+    Parameters
+    ----------
+    design: np.ndarray
+        n x k design matrix
+
+    Returns
+    -------
+    dict: dictionary
+        k x k Gram matrix (gram)
+        and its factorisation
+    """
+    gram = np.asarray(design.T @ design)
+    return {"gram": gram, **factorise_gram(gram)}
+
+
+def factorise_gram(gram: np.ndarray) -> dict:
+    """
+    Function to factorise a small k x k
+    Gram matrix once so that least squares
+    problems against it can be solved
+    by substitution.
+
+    Parameters
+    ----------
+    gram: np.ndarray
+        k x k Gram matrix
+
+    Returns
+    -------
+    dict: dictionary
+        Cholesky factor (cholesky) or
+        pseudo-inverse (pinv) if the
+        Gram matrix is singular
+    """
+    try:
+        return {"cholesky": cho_factor(gram)}
+    except np.linalg.LinAlgError:
+        return {"pinv": np.linalg.pinv(gram, hermitian=True)}
+
+
+def solve_gram(factor: dict, rhs: np.ndarray) -> np.ndarray:
+    """
+    Function to solve gram @ x = rhs
+    with a factorised Gram matrix.
+
+    Parameters
+    ----------
+    factor: dict
+        output of factorise_gram
+    rhs: np.ndarray
+        k x m right hand side
+
+    Returns
+    -------
+    np.ndarray: array
+        k x m solution
+    """
+    if "cholesky" in factor:
+        return cho_solve(factor["cholesky"], rhs)
+    return factor["pinv"] @ rhs
+
+
 def nmf_dual_regression(
-    components: dict, connectivity_matrix: np.ndarray, n_jobs: int = -1
+    components: dict,
+    connectivity_matrix: np.ndarray,
+    n_jobs: int = -1,
+    tol: float = 0,
 ) -> dict:
     """
     Dual regression function for NMF.
@@ -104,16 +267,172 @@ def nmf_dual_regression(
     n_jobs: int
         Number of parallel jobs for computation.
         Default is -1 (all available CPUs).
+    tol: float
+        Tolerance of the batched nnls solver.
+        If 0 every column is solved exactly
+        with scipy's nnls. Default is 0
+
+    Returns
+    -------
+    dict
+        Dictionary of components.
+    """
+    if n_jobs and int(n_jobs) > 1:
+        return nnls_parallel(components, connectivity_matrix, n_jobs, tol)
+    if tol:
+        return nnls_batched(components, connectivity_matrix, tol)
+    return nnls_non_parallel(components, connectivity_matrix)
+
+
+def nnls_batched(
+    components: dict, connectivity_matrix: np.ndarray, tol: float = 1e-4
+) -> dict:
+    """
+    Dual regression method for NMF solving
+    all voxels and then all vertices at
+    once with the batched nnls solver.
+
+    Parameters
+    ----------
+    components: dict
+        Dictionary of components.
+    connectivity_matrix: np.ndarray
+        Subjects' loaded connectivity matrix.
+    tol: float
+        Tolerance of the batched nnls
+        solver. Default is 1e-4
 
     Returns
     -------
     dict
         Dictionary of components.
     """
+    col = colours()
+    nprint(f"{col['pink']}Regression:{col['reset']} White Matter")
+    wm_component_white_map = batched_nnls(
+        components["grey_components"],
+        connectivity_matrix,
+        tol,
+        gram=components.get("grey_gram"),
+    )
+    nprint(f"{col['pink']}Regression:{col['reset']} Grey Matter")
+    gm_component_grey_map = batched_nnls(
+        wm_component_white_map.T, connectivity_matrix.T, tol
+    ).T
+    return {
+        "grey_components": gm_component_grey_map,
+        "white_components": wm_component_white_map,
+    }
+
+
+def batched_nnls(
+    design: np.ndarray,
+    targets: np.ndarray,
+    tol: float = 1e-4,
+    max_iter: int = 1000,
+    chunk_size: int = 4096,
+    gram: dict = None,
+) -> np.ndarray:
+    """
+    Function to solve min ||design @ x - target||
+    subject to x >= 0 for every column of targets
+    at once.
+
+    Every column shares the k x k Gram matrix of
+    the design. Columns start from the unconstrained
+    least squares solution (clipped at zero) and
+    are refined with coordinate descent on the
+    normal equations in chunks until the projected
+    gradient has dropped by tol.
+
+    Parameters
+    ----------
+    design: np.ndarray
+        n x k design matrix
+    targets: np.ndarray
+        n x m matrix of targets
+    tol: float
+        relative projected gradient to
+        stop at. Smaller is more accurate
+        but takes more iterations.
+        Default is 1e-4
+    max_iter: int
+        maximum number of coordinate
+        descent sweeps. Default is 1000
+    chunk_size: int
+        number of columns to solve
+        together. Default is 4096
+    gram: dict
+        output of gram_factor for the
+        design if already computed.
+        Default is None
+
+    Returns
+    -------
+    coefficients: np.ndarray
+        k x m non negative coefficients
+    """
+    if gram is None:
+        gram = gram_factor(design)
+    projection = np.asarray(design.T @ targets)
+    coefficients = np.maximum(solve_gram(gram, projection), 0)
+    for chunk in gen_batches(projection.shape[1], chunk_size):
+        coefficients[:, chunk] = nnls_coordinate_descent(
+            gram["gram"], projection[:, chunk], coefficients[:, chunk], tol, max_iter
+        )
+    return coefficients
+
+
+def nnls_coordinate_descent(
+    gram: np.ndarray,
+    projection: np.ndarray,
+    coefficients: np.ndarray,
+    tol: float = 1e-4,
+    max_iter: int = 1000,
+) -> np.ndarray:
+    """
+    Function to refine non negative least
+    squares coefficients with coordinate
+    descent on the normal equations.
 
-    if int(n_jobs) <= 1 or not n_jobs:
-        return nnls_non_parallel(components, connectivity_matrix)
-    return nnls_parallel(components, connectivity_matrix, n_jobs)
+    Parameters
+    ----------
+    gram: np.ndarray
+        k x k Gram matrix of the design
+    projection: np.ndarray
+        k x m design.T @ targets
+    coefficients: np.ndarray
+        k x m non negative starting
+        coefficients. Updated in place
+    tol: float
+        relative projected gradient
+        to stop at. Default is 1e-4
+    max_iter: int
+        maximum number of sweeps.
+        Default is 1000
+
+    Returns
+    -------
+    coefficients: np.ndarray
+        k x m non negative coefficients
+    """
+    initial_gradient = np.linalg.norm(np.maximum(projection, 0))
+    diagonal = np.diag(gram)
+    for _ in range(max_iter):
+        gradient = gram @ coefficients - projection
+        projected_gradient = np.where(
+            coefficients > 0, gradient, np.minimum(gradient, 0)
+        )
+        if np.linalg.norm(projected_gradient) <= tol * initial_gradient:
+            break
+        for component in np.flatnonzero(diagonal > 0):
+            coefficients[component] = np.maximum(
+                coefficients[component]
+                - (gram[component] @ coefficients - projection[component])
+                / diagonal[component],
+                0,
+            )
+    return coefficients
 
 
 def nnls_non_parallel(components: dict, connectivity_matrix: np.ndarray):
@@ -165,18 +484,131 @@ def nnls_non_parallel(components: dict, connectivity_matrix: np.ndarray):
     }
 
 
-def nnls_grey(col, grey_components, connectivity_matrix):
-    return nnls(grey_components, connectivity_matrix[:, col])[0]
+def solve_nnls(
+    design: np.ndarray, targets: np.ndarray, tol: float = 0, gram: dict = None
+) -> np.ndarray:
+    """
+    Function to solve non negative least
+    squares for every column of targets.
 
+    Parameters
+    ----------
+    design: np.ndarray
+        n x k design matrix
+    targets: np.ndarray
+        n x m matrix of targets
+    tol: float
+        Tolerance of the batched nnls solver.
+        If 0 every column is solved exactly
+        with scipy's nnls. Default is 0
+    gram: dict
+        output of gram_factor for the
+        design if already computed.
+        Default is None
 
-def nnls_white(col, wm_component_white_map_T, connectivity_matrix):
-    return nnls(wm_component_white_map_T, connectivity_matrix.T[:, col])[0]
+    Returns
+    -------
+    np.ndarray: array
+        k x m non negative coefficients
+    """
+    if tol:
+        return batched_nnls(design, targets, tol, gram=gram)
+    return np.array(
+        [nnls(design, targets[:, column])[0] for column in range(targets.shape[1])]
+    ).T
 
 
-def nnls_parallel(components: dict, connectivity_matrix: np.ndarray, n_jobs: int = -1):
+def nnls_chunk(
+    design: np.ndarray,
+    connectivity_matrix: np.ndarray,
+    output: np.ndarray,
+    chunk: slice,
+    grey_matter: bool,
+    tol: float = 0,
+    gram: dict = None,
+) -> None:
+    """
+    Function to solve a contiguous chunk
+    of the dual regression and write it
+    straight into the shared output.
+
+    Parameters
+    ----------
+    design: np.ndarray
+        grey components for the white matter
+        regression or the white matter map
+        for the grey matter regression
+    connectivity_matrix: np.ndarray
+        Subjects' connectivity matrix
+    output: np.ndarray
+        memory mapped output
+    chunk: slice
+        columns (white matter) or
+        rows (grey matter) to solve
+    grey_matter: bool
+        solve the grey matter regression
+    tol: float
+        Tolerance of the batched nnls solver.
+        Default is 0
+    gram: dict
+        output of gram_factor for the
+        design if already computed.
+        Default is None
+
+    Returns
+    -------
+    None
+    """
+    if grey_matter:
+        output[chunk] = solve_nnls(design.T, connectivity_matrix[chunk].T, tol, gram).T
+    else:
+        output[:, chunk] = solve_nnls(design, connectivity_matrix[:, chunk], tol, gram)
+    output.flush()
+
+
+def shared_array(array: np.ndarray, directory: str, name: str) -> np.ndarray:
+    """
+    Function to write an array once
+    to a directory and open it read only
+    memory mapped so parallel workers share
+    it instead of being sent a copy.
+
+    Parameters
+    ----------
+    array: np.ndarray
+        array to share
+    directory: str
+        directory to write to
+    name: str
+        name of array
+
+    Returns
+    -------
+    np.ndarray: array
+        read only memory mapped array
+    """
+    if isinstance(array, np.memmap):
+        return array
+    path = os.path.join(directory, f"{name}.npy")
+    np.save(path, array)
+    return np.load(path, mmap_mode="r")
+
+
+def nnls_parallel(
+    components: dict,
+    connectivity_matrix: np.ndarray,
+    n_jobs: int = -1,
+    tol: float = 0,
+    chunk_size: int = 1024,
+):
     """
     Dual regression function for NMF with optimized performance.
 
+    Inputs are memory mapped once and workers are
+    given contiguous chunks of columns (white matter)
+    or rows (grey matter) that they write straight
+    into a preallocated memory mapped output.
+
     Parameters
     ----------
     components: dict
@@ -186,6 +618,13 @@ def nnls_parallel(components: dict, connectivity_matrix: np.ndarray, n_jobs: int
     n_jobs: int
         Number of parallel jobs for computation.
         Default is -1 (all available CPUs).
+    tol: float
+        Tolerance of the batched nnls solver.
+        If 0 every column is solved exactly
+        with scipy's nnls. Default is 0
+    chunk_size: int
+        number of columns or rows
+        per task. Default is 1024
 
     Returns
     -------
@@ -194,29 +633,62 @@ def nnls_parallel(components: dict, connectivity_matrix: np.ndarray, n_jobs: int
     """
     time = Timer()
     time.tic()
-
-    grey_components = components["grey_components"]
+    n_jobs = int(n_jobs)
+    n_components = components["grey_components"].shape[1]
+    n_seeds, n_targets = connectivity_matrix.shape
     col = colours()
-    nprint(f"{col['pink']}Regression:{col['reset']} White Matter")
-    wm_component_white_map = np.array(
-        Parallel(n_jobs=n_jobs)(
-            delayed(nnls_grey)(col, grey_components, connectivity_matrix)
-            for col in range(connectivity_matrix.shape[1])
-        )
-    ).T
 
-    nprint(f"{col['pink']}Regression:{col['reset']} Grey Matter")
-    time.tic()
-    wm_component_white_map_T = wm_component_white_map.T
-    gm_component_grey_map = np.array(
-        Parallel(n_jobs=n_jobs)(
-            delayed(nnls_white)(col, wm_component_white_map_T, connectivity_matrix)
-            for col in range(connectivity_matrix.shape[0])
+    with tempfile.TemporaryDirectory() as shared_dir:
+        connectivity_matrix = shared_array(
+            connectivity_matrix, shared_dir, "connectivity_matrix"
+        )
+        grey_components = shared_array(
+            components["grey_components"], shared_dir, "grey_components"
+        )
+        wm_component_white_map = np.lib.format.open_memmap(
+            os.path.join(shared_dir, "white_map.npy"),
+            mode="w+",
+            dtype=np.float64,
+            shape=(n_components, n_targets),
+        )
+        gm_component_grey_map = np.lib.format.open_memmap(
+            os.path.join(shared_dir, "grey_map.npy"),
+            mode="w+",
+            dtype=np.float64,
+            shape=(n_seeds, n_components),
         )
-    )
-    nprint(f"Dual regression took {time.how_long()}")
 
-    return {
-        "grey_components": gm_component_grey_map,
-        "white_components": wm_component_white_map,
-    }
+        with Parallel(n_jobs=n_jobs) as parallel:
+            nprint(f"{col['pink']}Regression:{col['reset']} White Matter")
+            parallel(
+                delayed(nnls_chunk)(
+                    grey_components,
+                    connectivity_matrix,
+                    wm_component_white_map,
+                    chunk,
+                    False,
+                    tol,
+                    components.get("grey_gram"),
+                )
+                for chunk in gen_batches(n_targets, chunk_size)
+            )
+            nprint(f"{col['pink']}Regression:{col['reset']} Grey Matter")
+            parallel(
+                delayed(nnls_chunk)(
+                    wm_component_white_map,
+                    connectivity_matrix,
+                    gm_component_grey_map,
+                    chunk,
+                    True,
+                    tol,
+                )
+                for chunk in gen_batches(n_seeds, chunk_size)
+            )
+        dr_results = {
+            "grey_components": np.array(gm_component_grey_map),
+            "white_components": np.array(wm_component_white_map),
+        }
+        del wm_component_white_map, gm_component_grey_map, connectivity_matrix
+        del grey_components
+    nprint(f"Dual regression took {time.how_long()}")
+    return dr_results
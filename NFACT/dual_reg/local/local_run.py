@@ -11,6 +11,9 @@ from NFACT.dual_reg.nfact_dr_functions import (
 from NFACT.base.utils import nprint, colours, error_and_exit
 from NFACT.base.matrix_handling import normalise_components
 from NFACT.base.matrix_handling import load_fdt_matrix
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 import numpy as np
 import os
 
@@ -35,7 +38,12 @@ class Dual_regression:
             list_of_files=list_of_subjects,
             component=components,
             seeds=seeds,
-            nfact_directory=/path/to/nfact_dir)
+            nfact_directory=/path/to/nfact_dir,
+            roi=roi,
+            cache_dir=/path/to/cache_dir,
+            nnls_tol=0,
+            memory_budget=False,
+            skip=list_of_subjects_to_skip)
     dual_reg.run()
     """
 
@@ -49,6 +57,10 @@ class Dual_regression:
         seeds: list,
         nfact_directory: str,
         roi: list,
+        cache_dir: str = None,
+        nnls_tol: float = 0,
+        memory_budget: float = False,
+        skip: list = None,
     ) -> None:
         self.algo = algo
         self.normalise = normalise
@@ -58,10 +70,21 @@ class Dual_regression:
         self.seeds = seeds
         self.nfact_directory = nfact_directory
         self.roi = roi
+        self.cache_dir = cache_dir
+        self.nnls_tol = nnls_tol
+        self.memory_budget = memory_budget
+        self.skip = skip if skip else []
 
     def run(self) -> None:
         """
-        Runs non parallel regression.
+        Runs regression over subjects.
+
+        Loading, regression and saving overlap.
+        The next subjects are loaded by a pool of
+        threads while the current subject is regressed,
+        and results are handed to a pool of writer
+        threads. The number of loaded matrices held at
+        once is bounded by the memory budget.
 
         Parameters
         ----------
@@ -72,23 +95,137 @@ class Dual_regression:
         None
         """
         decomp = self.__decomp_method()
+        workers = self.__workers()
         col = colours()
-        for idx, subject in enumerate(self.list_of_file):
-            subject_id = get_subject_id(subject, idx)
-            nprint(
-                f"\n{col['pink']}Dual regressing on subject:{col['reset']} {subject_id}"
-            )
-            connectivity_matrix = self.__connecitivity_matrix(subject)
-            dr_results = run_decomp(
-                decomp, self.component, connectivity_matrix, self.parallel
-            )
-            if self.normalise:
-                normalised = normalise_components(
-                    dr_results["grey_components"], dr_results["white_components"]
+        subjects = (
+            (idx, subject)
+            for idx, subject in enumerate(self.list_of_file)
+            if subject not in self.skip
+        )
+        slots = self.__loaded_slots()
+        loaders = ThreadPoolExecutor(workers["io"])
+        writers = ThreadPoolExecutor(workers["io"])
+        with loaders, writers:
+            loading = {}
+            self.__prefetch(loaders, subjects, loading, slots)
+            saving = set()
+            while loading:
+                finished, _ = wait(loading, return_when=FIRST_COMPLETED)
+                loaded = finished.pop()
+                idx, subject = loading.pop(loaded)
+                matrix = loaded.result()
+                # Drop the future so the matrix is freed after regression
+                del finished, loaded
+                self.__prefetch(loaders, subjects, loading, slots - 1)
+                subject_id = get_subject_id(subject, idx)
+                nprint(
+                    f"\n{col['pink']}Dual regressing on subject:{col['reset']} {subject_id}"
+                )
+                dr_results = run_decomp(
+                    decomp, self.component, matrix, workers["regression"]
                 )
-                dr_results["normalised_white"] = normalised["white_matter"]
-                dr_results["normalised_grey"] = normalised["grey_matter"]
-            self.__save_image(dr_results, subject, subject_id)
+                del matrix
+                self.__prefetch(loaders, subjects, loading, slots)
+                if self.normalise:
+                    normalised = normalise_components(
+                        dr_results["grey_components"],
+                        dr_results["white_components"],
+                    )
+                    dr_results["normalised_white"] = normalised["white_matter"]
+                    dr_results["normalised_grey"] = normalised["grey_matter"]
+                if len(saving) >= 2 * workers["io"]:
+                    saved, saving = wait(saving, return_when=FIRST_COMPLETED)
+                    [save.result() for save in saved]
+                saving.add(
+                    writers.submit(self.__save_image, dr_results, subject, subject_id)
+                )
+            [save.result() for save in saving]
+
+    def __prefetch(
+        self, loaders: object, subjects: object, loading: dict, slots: int
+    ) -> None:
+        """
+        Method to submit subjects to the
+        loading threads until slots matrices
+        are loaded or loading.
+
+        Parameters
+        ----------
+        loaders: ThreadPoolExecutor
+            pool of loading threads
+        subjects: generator
+            generator of subject index
+            and path still to load
+        loading: dict
+            dict of loading future to
+            subject index and path.
+            Updated in place
+        slots: int
+            number of matrices that
+            can be loaded or loading
+
+        Returns
+        -------
+        None
+        """
+        for idx, subject in islice(subjects, max(0, slots - len(loading))):
+            loading[loaders.submit(self.__connecitivity_matrix, subject)] = (
+                idx,
+                subject,
+            )
+
+    def __workers(self) -> dict:
+        """
+        Method to split the number of
+        cores between loading/saving threads
+        and the regression.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict: dictionary
+            number of loading/saving
+            threads (io) and number of
+            regression jobs (regression),
+            None if not ran in parallel
+        """
+        total_workers = int(self.parallel) if self.parallel else 1
+        io_workers = max(1, total_workers // 4)
+        return {
+            "io": io_workers,
+            "regression": max(1, total_workers - 2 * io_workers)
+            if self.parallel
+            else None,
+        }
+
+    def __loaded_slots(self) -> int:
+        """
+        Method to get the number of subjects'
+        matrices that can be held in memory at
+        once, including the one being regressed.
+        Without a memory budget one subject is
+        loaded while another is regressed.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        int: integer
+            number of matrices
+        """
+        if not self.memory_budget:
+            return 2
+        matrix_size = (
+            self.component["grey_components"].shape[0]
+            * self.component["white_components"].shape[1]
+            * np.dtype(np.float32).itemsize
+        )
+        return max(1, int(float(self.memory_budget) * 1024**3 // matrix_size))
 
     def __decomp_method(self) -> object:
         """
@@ -104,7 +241,9 @@ class Dual_regression:
            either self.__ica_dual_regression
            or self.__nmf_dual_regression
         """
-        return ica_dual_regression if self.algo == "ica" else nmf_dual_regression
+        if self.algo == "ica":
+            return ica_dual_regression
+        return partial(nmf_dual_regression, tol=self.nnls_tol)
 
     def __connecitivity_matrix(self, subject: str) -> np.ndarray:
         """
@@ -120,7 +259,9 @@ class Dual_regression:
         np.ndarray: array
             loaded fdt matrix
         """
-        return load_fdt_matrix(os.path.join(subject, "fdt_matrix2.dot"))
+        return load_fdt_matrix(
+            os.path.join(subject, "fdt_matrix2.dot"), cache_dir=self.cache_dir
+        )
 
     def __save_image(self, components: dict, subject: str, subject_id) -> None:
         """
@@ -178,6 +319,7 @@ def run_locally(args: dict, paths: dict):
             paths["group_average_path"],
             args["seeds"],
             args["roi"],
+            paths["dim"],
         )
     except Exception:
         error_and_exit(False, "Unable to find components")
@@ -194,5 +336,9 @@ def run_locally(args: dict, paths: dict):
         seeds=args["seeds"],
         nfact_directory=os.path.join(args["outdir"], "nfact_dr"),
         roi=args["roi"],
+        cache_dir=args["cache_dir"],
+        nnls_tol=args["nnls_tol"],
+        memory_budget=args["memory_budget"],
+        skip=args["skip"],
     )
     dual_reg.run()
@@ -7,6 +7,7 @@ from NFACT.base.base_args import (
     seed_roi_args,
     algo_arg,
     cluster_args,
+    cache_args,
 )
 
 
@@ -49,6 +50,18 @@ def nfactdr_args() -> dict:
         help="""Filepath to decomposition components. 
         WARNING NFACT decomp expects components to be named in a set way. See documentation for further info.""",
     )
+    dr_args.add_argument(
+        "-dm",
+        "--dim",
+        dest="dim",
+        default=False,
+        help="""
+        Dimension of the group components to dual regress. 
+        Needed when the components directory has more than 
+        one dimension, as after nfact_decomp --sweep. 
+        Default is the only dimension found.
+        """,
+    )
     dr_args.add_argument(
         "-N",
         "--normalise",
@@ -57,9 +70,74 @@ def nfactdr_args() -> dict:
         default=False,
         help="normalise components by scaling",
     )
+    dr_args.add_argument(
+        "-nt",
+        "--nnls_tol",
+        dest="nnls_tol",
+        default="0",
+        help="""
+        Tolerance of the batched non-negative least squares 
+        solver used for NMF dual regression. Smaller values are 
+        more accurate but slower. 0 solves each voxel and 
+        vertex exactly with scipy's nnls. Try 1e-4 for a much 
+        faster approximate solve. Default is 0
+        """,
+    )
+    dr_args.add_argument(
+        "-mb",
+        "--memory_budget",
+        dest="memory_budget",
+        default=False,
+        help="""
+        Memory in GB that loaded subjects' connectivity 
+        matrices can use when running locally. Subjects are 
+        loaded ahead of the one being regressed until this is 
+        used up. Default is to load one subject ahead 
+        of the one being regressed. --n_cores is split between loading, 
+        regression and saving threads.
+        """,
+    )
+
+    dr_args.add_argument(
+        "-I",
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        default=False,
+        help="""
+        Only dual regress new or changed subjects. Subjects 
+        whose outputs all exist and are newer than both the 
+        group components and their fdt_matrix2.dot are skipped.
+        """,
+    )
 
     parallel_args(base_args, col, "To parallelize dual regression")
-    cluster_args(base_args, col)
+    cluster_options = cluster_args(base_args, col)
+    cluster_options.add_argument(
+        "-aj",
+        "--array_job",
+        dest="array_job",
+        action="store_true",
+        default=False,
+        help="""
+        Submit all dual regression jobs to the 
+        cluster as a single fsl_sub array job 
+        rather than one job per subject.
+        """,
+    )
+    cluster_options.add_argument(
+        "-sj",
+        "--subjects_per_job",
+        dest="subjects_per_job",
+        default="1",
+        help="""
+        Number of subjects each cluster job 
+        dual regresses. Components are loaded 
+        once per job and cluster time is scaled 
+        by this number. Default is 1
+        """,
+    )
+    cache_args(base_args, col)
     no_args(base_args)
     options = base_args.parse_args()
     if options.verbose_help:
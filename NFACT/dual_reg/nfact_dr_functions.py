@@ -1,8 +1,13 @@
 from NFACT.base.imagehandling import (
+    name_seed,
+    imaging_type,
     save_grey_matter_components,
     save_white_matter,
+    lookup_indices,
+    gather_from_volume,
 )
 from NFACT.base.utils import colours, nprint, error_and_exit
+from NFACT.dual_reg.dual_regression import dr_model
 import numpy as np
 import os
 import nibabel as nb
@@ -92,15 +97,9 @@ def vol2mat(matvol: np.ndarray, lut_vol: np.ndarray) -> np.ndarray:
         array of volume data converted back
         to original matrix form
     """
-    mask = lut_vol > 0
-    num_rows = matvol.shape[-1]
-    matrix = np.zeros((num_rows, np.max(lut_vol)))
-
-    for row in range(num_rows):
-        matrix[row, lut_vol[mask] - 1] = matvol.reshape(-1, num_rows)[
-            mask.flatten(), row
-        ]
-
+    indices = lookup_indices(lut_vol)
+    matrix = np.zeros((matvol.shape[-1], np.max(lut_vol)), dtype=np.float32)
+    matrix[:, indices["columns"]] = gather_from_volume(matvol, indices["voxels"]).T
     return matrix
 
 
@@ -176,7 +175,9 @@ def save_dual_regression_images(
             )
 
 
-def white_component(component_dir: str, group_averages_dir: str) -> np.ndarray:
+def white_component(
+    component_dir: str, group_averages_dir: str, dim: int
+) -> np.ndarray:
     """
     Function to get the group level
     white matter component for dual regression.
@@ -185,8 +186,10 @@ def white_component(component_dir: str, group_averages_dir: str) -> np.ndarray:
     ----------
     component_dir: str
         path to the saved components
-    algo: str
-        The algorithm for dual regression
+    group_averages_dir: str
+        path to group averages directory
+    dim: int
+        number of dimensions
 
     Returns
     -------
@@ -197,7 +200,7 @@ def white_component(component_dir: str, group_averages_dir: str) -> np.ndarray:
     lookup_vol = nb.load(
         os.path.join(group_averages_dir, "lookup_tractspace_fdt_matrix2.nii.gz")
     )
-    white_matter = nb.load(glob(os.path.join(component_dir, "W_*_dim*"))[0])
+    white_matter = nb.load(glob(os.path.join(component_dir, f"W_*_dim{dim}.*"))[0])
     return vol2mat(
         white_matter.get_fdata().astype(np.int32),
         lookup_vol.get_fdata().astype(np.int32),
@@ -222,12 +225,11 @@ def load_grey_matter_volume(nifti_file: str, x_y_z_coordinates: np.array) -> np.
         Grey matter component matrix
     """
     img = nb.load(nifti_file)
-    data = img.get_fdata()
-    vol_shape = data.shape[:3]
-    xyz_idx = np.ravel_multi_index(x_y_z_coordinates.T, vol_shape)
-    ncols = data.shape[3] if len(data.shape) > 3 else 1
-    flattened_data = data.reshape(-1, ncols)
-    return flattened_data[xyz_idx, :]
+    data = img.get_fdata(dtype=np.float32)
+    xyz_idx = np.ravel_multi_index(x_y_z_coordinates.T, data.shape[:3])
+    if data.ndim == 3:
+        data = data[..., np.newaxis]
+    return gather_from_volume(data, xyz_idx)
 
 
 def load_grey_matter_gifti_seed(file_name: str, roi: str) -> np.array:
@@ -255,7 +257,7 @@ def load_grey_matter_gifti_seed(file_name: str, roi: str) -> np.array:
 
 
 def grey_components(
-    seeds: list, decomp_dir: str, group_averages: str, mw: list
+    seeds: list, decomp_dir: str, group_averages: str, mw: list, dim: int
 ) -> np.ndarray:
     """
     Function to get grey components.
@@ -270,13 +272,15 @@ def grey_components(
         str to group averages directory
     mw: list
         list of wedial wall files
+    dim: int
+        number of dimensions
 
     Returns
     -------
     np.ndarray: np.array
         grey matter components array
     """
-    grey_matter = glob(os.path.join(decomp_dir, "G_*dim*"))
+    grey_matter = glob(os.path.join(decomp_dir, f"G_*_dim{dim}_*"))
     seed_key_word = get_key_to_organise_list(seeds[0])
     sorted_components = sort_grey_matter_order(grey_matter, seed_key_word)
     save_type = "gii" if "gii" in sorted_components[0] else "nii"
@@ -304,7 +308,11 @@ def grey_components(
 
 
 def get_group_level_components(
-    component_dir: str, group_averages_dir: str, seeds: list, mw: list
+    component_dir: str,
+    group_averages_dir: str,
+    seeds: list,
+    mw: list,
+    dim: int = None,
 ):
     """
     Function to get group level components
@@ -319,18 +327,27 @@ def get_group_level_components(
         A list of seeds
     mw: list
         list of wedial wall files
+    dim: int
+        number of dimensions of the
+        components. Default is None
+        which uses the only dimension
+        in component_dir
 
     Returns
     -------
     dict: dictionary
-        dict of components
+        dual regression model of the
+        components. See dr_model
     """
-    return {
-        "white_components": white_component(component_dir, group_averages_dir),
-        "grey_components": grey_components(
-            seeds, component_dir, group_averages_dir, mw
-        ),
-    }
+    dim = dim if dim else component_dim(component_dir)
+    return dr_model(
+        {
+            "white_components": white_component(component_dir, group_averages_dir, dim),
+            "grey_components": grey_components(
+                seeds, component_dir, group_averages_dir, mw, dim
+            ),
+        }
+    )
 
 
 def get_paths(args: dict) -> dict:
@@ -397,3 +414,174 @@ def get_subject_id(path: str, number: int) -> str:
             except IndexError:
                 pass
         return f"sub-{number}"
+
+
+def component_dim(component_dir: str, dim: int = False) -> int:
+    """
+    Function to get the number of
+    dimensions of the group components
+    from the white matter file names.
+    Exits if dim is not found or if no
+    dim is given and the components have
+    more than one dimension.
+
+    Parameters
+    ----------
+    component_dir: str
+        path to the saved components
+    dim: int
+        number of dimensions to use.
+        Default is False which uses the
+        only dimension found
+
+    Returns
+    -------
+    int: integer
+        number of dimensions
+    """
+    white_matter = glob(os.path.join(component_dir, "W_*_dim*"))
+    error_and_exit(white_matter, "Unable to find white matter component")
+    dims = sorted(
+        {
+            int(re.findall(r"dim(\d+)", os.path.basename(white_file))[0])
+            for white_file in white_matter
+        }
+    )
+    if dim:
+        error_and_exit(
+            int(dim) in dims,
+            f"No components of dim {dim} found. Dimensions found: {', '.join(map(str, dims))}",
+        )
+        return int(dim)
+    error_and_exit(
+        len(dims) == 1,
+        f"Components of more than one dimension found ({', '.join(map(str, dims))}). Specify which with --dim",
+    )
+    return dims[0]
+
+
+def subject_outputs(
+    nfact_path: str, seeds: list, algo: str, dim: int, sub: str, normalise: bool
+) -> list:
+    """
+    Function to get the glob patterns
+    of a subjects dual regression outputs.
+
+    Parameters
+    ----------
+    nfact_path: str
+        str to nfact_dr directory
+    seeds: list
+        list of seeds
+    algo: str
+        str of algo
+    dim: int
+        number of dimensions
+    sub: str
+        Subject id in string format
+    normalise: bool
+        if normalised outputs are saved
+
+    Returns
+    -------
+    list: list object
+        list of glob patterns, one
+        per output
+    """
+    outputs = [("", algo, "")]
+    if normalise:
+        outputs.append(("_norm", os.path.join(algo, "normalised"), "_norm"))
+    patterns = []
+    for w_suffix, algo_path, grey_suffix in outputs:
+        patterns.append(
+            os.path.join(nfact_path, algo_path, f"W_{sub}{w_suffix}_dim{dim}.*")
+        )
+        for seed in seeds:
+            file_name = name_seed(
+                seed, nfact_path, algo_path, f"G_{sub}{grey_suffix}", dim
+            )
+            # Mirrors the renaming in save_grey_matter_components
+            if imaging_type(seed) == "gifti":
+                file_name = re.sub("_gii", "", file_name)
+            else:
+                file_name = re.sub("_gz", "", re.sub("_nii", "", file_name))
+            patterns.append(f"{file_name}*")
+    return patterns
+
+
+def subject_regressed(
+    outputs: list, fdt_matrix: str, components_modified: float
+) -> bool:
+    """
+    Function to check if a subject has
+    all its dual regression outputs and
+    they are newer than its fdt_matrix2.dot
+    and the group components.
+
+    Parameters
+    ----------
+    outputs: list
+        output of subject_outputs
+    fdt_matrix: str
+        path to subjects fdt_matrix2.dot
+    components_modified: float
+        time the group components
+        were last modified
+
+    Returns
+    -------
+    bool: boolean
+        True if subject does not need
+        to be regressed again
+    """
+    output_files = [glob(pattern) for pattern in outputs]
+    if not all(output_files) or not os.path.exists(fdt_matrix):
+        return False
+    oldest_output = min(
+        os.path.getmtime(output) for files in output_files for output in files
+    )
+    return oldest_output > max(os.path.getmtime(fdt_matrix), components_modified)
+
+
+def completed_subjects(args: dict, paths: dict) -> list:
+    """
+    Function to get the subjects whose
+    dual regression outputs are complete
+    and up to date.
+
+    Parameters
+    ----------
+    args: dict
+        dictionary of command line
+        arguments
+    paths: dict
+        dictionary of component paths
+
+    Returns
+    -------
+    list: list object
+        list of subjects paths to skip
+    """
+    dim = paths["dim"]
+    components_modified = max(
+        os.path.getmtime(component)
+        for pattern in [f"W_*_dim{dim}.*", f"G_*_dim{dim}_*"]
+        for component in glob(os.path.join(paths["component_path"], pattern))
+    )
+    nfact_path = os.path.join(args["outdir"], "nfact_dr")
+    return [
+        sub
+        for idx, sub in enumerate(args["ptxdir"])
+        if subject_regressed(
+            subject_outputs(
+                nfact_path,
+                args["seeds"],
+                args["algo"].upper(),
+                dim,
+                get_subject_id(sub, idx),
+                args["normalise"],
+            ),
+            os.path.join(sub, "fdt_matrix2.dot"),
+            components_modified,
+        )
+    ]
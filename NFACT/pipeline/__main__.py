@@ -6,6 +6,7 @@ from NFACT.pipeline.nfact_pipeline_functions import (
     compulsory_args_for_config,
     update_nfact_args,
     roi_file,
+    run_stage,
 )
 from NFACT.base.config import get_nfact_arguments, process_dictionary_arguments
 from NFACT.base.utils import error_and_exit, colours, Timer
@@ -109,17 +110,36 @@ def nfact_pipeline_main() -> None:
         nfact_pp_args["list_of_subjects"], nfact_pp_args["outdir"], nfact_tmp_location
     )
 
+    # Stages are skipped when their arguments and inputs match the manifest
+    manifest_path = os.path.join(nfact_pp_args["outdir"], "nfact_manifest.json")
+    # Overwriting deletes module outputs, so every stage has to run again
+    force = global_arguments["global_input"].get("force", False)
+    force = force or global_arguments["global_input"]["overwrite"]
+    nfact_pp_directory = os.path.join(nfact_pp_args["outdir"], "nfact_pp")
+    nfact_decomp_directory = os.path.join(nfact_decomp_args["outdir"], "nfact_decomp")
+    nfact_qc_directory = os.path.join(nfact_decomp_directory, "nfactQc")
+
     # Run NFACT_PP
+    pp_ran = False
     if not global_arguments["global_input"]["pp_skip"]:
         print(f"{col['plum']}Running:{col['reset']} NFACT PP")
         print("-" * 100)
         print(nfact_pp_splash())
-        nfact_pp_main(nfact_pp_args)
+        pp_ran = run_stage(
+            "nfact_pp",
+            nfact_pp_main,
+            nfact_pp_args,
+            [nfact_pp_args["list_of_subjects"]],
+            nfact_pp_directory,
+            manifest_path,
+            force,
+        )
 
         print(f"{col['pink']}\nFinished running NFACT_PP{col['reset']}")
         print("-" * 100)
     else:
         print(f"\n{col['plum']}Skipping:{col['reset']} NFACT_PP")
+    if not pp_ran:
         nfact_pp_args["list_of_subjects"] = read_file_to_list(
             nfact_pp_args["list_of_subjects"]
         )
@@ -139,7 +159,16 @@ def nfact_pipeline_main() -> None:
         )
 
     print(nfact_decomp_splash())
-    nfact_decomp_main(nfact_decomp_args)
+    run_stage(
+        "nfact_decomp",
+        nfact_decomp_main,
+        nfact_decomp_args,
+        [nfact_pp_directory, nfact_tmp_location],
+        nfact_decomp_directory,
+        manifest_path,
+        force,
+        [nfact_qc_directory],
+    )
     print(f"{col['plum']}\nFinished:{col['reset']} NFACT Decomp")
     print("-" * 100)
 
@@ -168,7 +197,16 @@ def nfact_pipeline_main() -> None:
         print(f"{col['plum']}Running:{col['reset']} NFACT Qc")
         print("-" * 100)
         print(nfact_Qc_splash())
-        nfactQc_main(nfact_qc_args)
+        run_stage(
+            "nfact_qc",
+            nfactQc_main,
+            nfact_qc_args,
+            [nfact_decomp_directory],
+            nfact_qc_directory,
+            manifest_path,
+            force,
+            [nfact_qc_directory],
+        )
         print(f"{col['plum']}\nFinished:{col['reset']} NFACT Qc")
         print("-" * 100)
     else:
@@ -181,7 +219,16 @@ def nfact_pipeline_main() -> None:
         print(f"\n\n{col['plum']}Running: {col['reset']} NFACT DR")
         print("-" * 100)
         print(nfact_dr_splash())
-        nfact_dr_main(nfact_dr_args)
+        run_stage(
+            "nfact_dr",
+            nfact_dr_main,
+            nfact_dr_args,
+            [nfact_pp_directory, nfact_decomp_directory],
+            os.path.join(nfact_dr_args["outdir"], "nfact_dr"),
+            manifest_path,
+            force,
+            [nfact_qc_directory],
+        )
         print(f"{col['plum']}\nFinished:{col['reset']} NFACT DR")
         print("-" * 100)
     else:
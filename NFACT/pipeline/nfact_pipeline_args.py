@@ -114,6 +114,18 @@ def nfact_parser() -> dict:
         action="store_true",
         help="Overwirte existing file structure",
     )
+    input_args.add_argument(
+        "-F",
+        "--force",
+        dest="force",
+        default=False,
+        action="store_true",
+        help="""
+        Run every module even if its arguments and inputs
+        are unchanged since the last run. By default modules
+        that are up to date in nfact_manifest.json are skipped.
+        """,
+    )
     cluster_options = cluster_args(args, col)
     nfact_pp_args = args.add_argument_group(
         f"{col['darker_pink']}nfact_pp inputs{col['reset']}"
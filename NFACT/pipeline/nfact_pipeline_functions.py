@@ -1,6 +1,8 @@
-from NFACT.base.utils import error_and_exit
+from NFACT.base.utils import error_and_exit, colours
 from NFACT.base.filesystem import read_file_to_list, write_to_file
 import os
+import json
+import hashlib
 
 
 def non_compulsory_arguments(additional_args: list = []) -> list:
@@ -283,6 +285,7 @@ def assign_nfact_dr(args: dict) -> None:
         "nfact_decomp",
     )
     args["nfact_dr"]["algo"] = args["nfact_decomp"]["algo"]
+    args["nfact_dr"]["dim"] = args["nfact_decomp"]["dim"]
     args["nfact_dr"]["overwrite"] = args["global_input"]["overwrite"]
     args["nfact_dr"].update(args["cluster"])
 
@@ -333,3 +336,179 @@ def update_nfact_args(args: dict) -> None:
     assign_nfactpp(args)
     assign_nfact_dr(args)
     assign_nfact_decomp(args)
+
+
+def file_fingerprint(path: str) -> str:
+    """
+    Function to fingerprint a file.
+    Small files are hashed so that
+    rewriting the same content does not
+    change them, large files use their
+    size and modification time.
+
+    Parameters
+    ----------
+    path: str
+        path to file
+
+    Returns
+    -------
+    str: string
+        fingerprint of file
+    """
+    file_stat = os.stat(path)
+    if file_stat.st_size > 2**20:
+        return f"{file_stat.st_size}:{file_stat.st_mtime_ns}"
+    with open(path, "rb") as file_to_hash:
+        return hashlib.sha256(file_to_hash.read()).hexdigest()
+
+
+def stage_files(paths: list, exclude: list = []) -> list:
+    """
+    Function to list every file in
+    a set of files and directories.
+
+    Parameters
+    ----------
+    paths: list
+        list of files and directories
+    exclude: list
+        list of directories to leave out
+
+    Returns
+    -------
+    list: list object
+        sorted list of files
+    """
+    exclude = [os.path.abspath(directory) for directory in exclude]
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for root, directories, file_names in os.walk(path):
+            directories[:] = [
+                directory
+                for directory in directories
+                if os.path.abspath(os.path.join(root, directory)) not in exclude
+            ]
+            files.extend(os.path.join(root, file_name) for file_name in file_names)
+    return sorted(files)
+
+
+def stage_fingerprint(stage_args: dict, inputs: list, exclude: list = []) -> str:
+    """
+    Function to fingerprint a pipeline
+    stage from its arguments and the
+    files it reads.
+
+    Parameters
+    ----------
+    stage_args: dict
+        arguments given to the stage
+    inputs: list
+        list of files and directories
+        the stage reads
+    exclude: list
+        list of directories to leave out
+
+    Returns
+    -------
+    str: string
+        fingerprint of stage
+    """
+    fingerprint = hashlib.sha256(
+        json.dumps(stage_args, sort_keys=True, default=str).encode()
+    )
+    for input_file in stage_files(inputs, exclude):
+        fingerprint.update(f"{input_file}={file_fingerprint(input_file)}".encode())
+    return fingerprint.hexdigest()
+
+
+def load_manifest(manifest_path: str) -> dict:
+    """
+    Function to load the pipeline
+    manifest.
+
+    Parameters
+    ----------
+    manifest_path: str
+        path to manifest
+
+    Returns
+    -------
+    dict: dictionary
+        manifest of stages or an
+        empty dict if there is none
+    """
+    try:
+        with open(manifest_path) as manifest:
+            return json.load(manifest)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def run_stage(
+    stage: str,
+    stage_function: object,
+    stage_args: dict,
+    inputs: list,
+    outputs: str,
+    manifest_path: str,
+    force: bool = False,
+    exclude: list = [],
+) -> bool:
+    """
+    Function to run a pipeline stage
+    unless the manifest shows it has
+    already run with the same arguments
+    and inputs and its outputs still exist.
+
+    Parameters
+    ----------
+    stage: str
+        name of stage
+    stage_function: object
+        function to run the stage
+    stage_args: dict
+        arguments given to stage_function
+    inputs: list
+        list of files and directories
+        the stage reads
+    outputs: str
+        directory the stage writes to
+    manifest_path: str
+        path to manifest
+    force: bool
+        run the stage regardless
+    exclude: list
+        list of directories to leave
+        out of inputs and outputs
+
+    Returns
+    -------
+    bool: boolean
+        True if the stage was ran
+    """
+    col = colours()
+    manifest = load_manifest(manifest_path)
+    fingerprint = stage_fingerprint(stage_args, inputs, exclude)
+    recorded = manifest.get(stage, {})
+    if (
+        not force
+        and recorded.get("fingerprint") == fingerprint
+        and recorded.get("outputs")
+        and all(os.path.exists(output) for output in recorded["outputs"])
+    ):
+        print(f"{col['plum']}Up to date:{col['reset']} {stage}. Skipping")
+        return False
+    stage_function(stage_args)
+    manifest = load_manifest(manifest_path)
+    manifest[stage] = {
+        "fingerprint": fingerprint,
+        "outputs": stage_files([outputs], exclude),
+    }
+    with open(f"{manifest_path}.tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return True
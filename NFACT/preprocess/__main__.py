@@ -52,6 +52,11 @@ def nfact_pp_main(arg: dict = None):
             False,
             "Unclear whether to parallel process locally or to submit to cluster. Remove either --n_cores or --cluster",
         )
+    if arg["resume"] and arg["overwrite"]:
+        error_and_exit(
+            False,
+            "Unclear whether to resume or overwrite. Remove either --resume or --overwrite",
+        )
     if arg["absolute"] and arg["file_tree"]:
         error_and_exit(
             False,
@@ -10,6 +10,7 @@ from NFACT.preprocess.nfactpp_functions import (
     process_filetree_args,
     create_files_for_decomp,
     write_options_to_file,
+    subject_completed,
 )
 from NFACT.preprocess.probtrackx_functions import (
     build_probtrackx2_arguments,
@@ -217,6 +218,36 @@ def set_up_filestree(arg: dict) -> dict:
     return arg
 
 
+def remaining_subjects(arg: dict, col: dict) -> list:
+    """
+    Function to get the subjects that
+    have not completed nfact_pp.
+
+    Parameters
+    ----------
+    arg: dict
+        dictionary of cmd line args
+    col: dict
+        dict of colours
+
+    Returns
+    -------
+    list: list object
+        list of subjects still to run
+    """
+    remaining = [
+        sub
+        for sub in arg["list_of_subjects"]
+        if not subject_completed(
+            os.path.join(arg["outdir"], "nfact_pp", os.path.basename(sub))
+        )
+    ]
+    print(
+        f"{col['pink']}Resume:{col['reset']} Skipping {len(arg['list_of_subjects']) - len(remaining)} completed subjects"
+    )
+    return remaining
+
+
 def pre_processing(arg: dict, handler: object) -> None:
     """
     Main function for nfact PP
@@ -249,10 +280,15 @@ def pre_processing(arg: dict, handler: object) -> None:
         f"{col['darker_pink']}Number of subjects:{col['reset']} {len(arg['list_of_subjects'])}"
     )
 
+    subjects_to_run = arg["list_of_subjects"]
+    if arg["resume"]:
+        subjects_to_run = remaining_subjects(arg, col)
+        if not subjects_to_run:
+            print(f"{col['pink']}Resume:{col['reset']} All subjects already completed")
+            return None
+
     print_to_screen("SUBJECT SETUP")
-    subjects_commands = [
-        process_subject(sub, arg, col) for sub in arg["list_of_subjects"]
-    ]
+    subjects_commands = [process_subject(sub, arg, col) for sub in subjects_to_run]
 
     # This supresses the signit kill message or else it prints it off multiple times for each core
     if arg["n_cores"]:
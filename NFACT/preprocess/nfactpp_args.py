@@ -176,6 +176,19 @@ def nfact_pp_args() -> dict:
         across all subjects.
         """,
     )
+    tractography_input.add_argument(
+        "-R",
+        "--resume",
+        action="store_true",
+        default=False,
+        dest="resume",
+        help="""
+        Skip subjects that have already completed nfact_pp 
+        (a complete fdt_matrix2.dot, coords and lookup files 
+        and no failed probtrackx2 exit code) and only run 
+        the remaining subjects.
+        """,
+    )
     parallel_args(
         base_args,
         col,
@@ -1,6 +1,7 @@
 from NFACT.base.utils import error_and_exit, colours
 from NFACT.base.imagehandling import check_files_are_imaging_files
 from NFACT.base.filesystem import write_to_file, load_json
+from NFACT.base.cluster_support import read_sentinel, sentinel_path
 import os
 from NFACT.preprocess.nfactpp_setup import check_provided_img
 
@@ -327,3 +328,75 @@ def write_options_to_file(file_path: str, text_to_save: str, name_of_file: str):
     if not file_written:
         return False
     return True
+
+
+def subject_completed(nfactpp_directory: str) -> bool:
+    """
+    Function to check if a subject
+    has completed nfact_pp. Needs a
+    valid fdt_matrix2.dot and non empty
+    coords and lookup files. If probtrackx2
+    wrote an exit code it must be zero.
+    Subjects ran by versions of nfact_pp
+    that did not write exit codes are
+    judged on their outputs alone.
+
+    Parameters
+    ----------
+    nfactpp_directory: str
+        subjects nfact_pp directory
+
+    Returns
+    -------
+    bool: boolean
+        True if subject has completed
+    """
+    omatrix = os.path.join(nfactpp_directory, "omatrix2")
+    outputs = [
+        os.path.join(omatrix, output)
+        for output in [
+            "fdt_matrix2.dot",
+            "coords_for_fdt_matrix2",
+            "lookup_tractspace_fdt_matrix2.nii.gz",
+        ]
+    ]
+    if not all(
+        os.path.isfile(output) and os.path.getsize(output) > 0 for output in outputs
+    ):
+        return False
+    if not fdt_matrix_complete(outputs[0]):
+        return False
+    exit_code = read_sentinel(
+        sentinel_path(
+            os.path.join(nfactpp_directory, "logs"),
+            f"nfact_pp_{os.path.basename(nfactpp_directory)}",
+        )
+    )
+    return exit_code in [None, "0"]
+
+
+def fdt_matrix_complete(fdt_matrix: str) -> bool:
+    """
+    Function to check that a fdt_matrix2.dot
+    was fully written, that is it ends with a
+    newline after a complete row of three
+    integers.
+
+    Parameters
+    ----------
+    fdt_matrix: str
+        path to fdt_matrix2.dot
+
+    Returns
+    -------
+    bool: boolean
+        True if the last row is complete
+    """
+    with open(fdt_matrix, "rb") as matrix_file:
+        matrix_file.seek(max(os.path.getsize(fdt_matrix) - 256, 0))
+        tail = matrix_file.read()
+    rows = [row for row in tail.split(b"\n") if row.strip()]
+    if not tail.endswith(b"\n") or not rows:
+        return False
+    values = rows[-1].split()
+    return len(values) == 3 and all(value.isdigit() for value in values)
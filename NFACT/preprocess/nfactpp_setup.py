@@ -4,7 +4,6 @@ from NFACT.base.filesystem import make_directory
 from NFACT.base.imagehandling import check_files_are_imaging_files
 import os
 import re
-from file_tree import FileTree
 
 
 def check_roi_seed_len(seed: list, roi: list):
@@ -119,6 +118,8 @@ def load_file_tree(tree_name: str) -> object:
     tree: FileTree object
         filetree object
     """
+    # Lazy import so the rest of nfact_pp can be imported without file_tree
+    from file_tree import FileTree
 
     return FileTree.read(
         os.path.join(os.path.dirname(os.path.dirname(__file__)), "filetree", tree_name)
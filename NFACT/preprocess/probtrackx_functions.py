@@ -1,13 +1,16 @@
 from NFACT.base.filesystem import get_current_date
-from NFACT.base.utils import colours, error_and_exit
+from NFACT.base.utils import colours, error_and_exit, Timer
 from NFACT.base.cluster_support import (
     cluster_submission,
+    sentinel_path,
+    write_sentinel,
     Queue_Monitoring,
 )
 import os
 import subprocess
-import multiprocessing
 import signal
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 
 
 def to_use_gpu():
@@ -456,6 +459,8 @@ class Probtrackx:
         self.cluster_ram = cluster_ram
         self.cluster_qos = cluster_qos
         self.gpu = gpu
+        self.sentinels = {}
+        self.processes = {}
 
     def run(self):
         """
@@ -500,22 +505,27 @@ class Probtrackx:
         submitted_jobs = [job for job in submitted_jobs if job is not None]
         if submitted_jobs:
             queue = Queue_Monitoring()
-            queue.monitor(submitted_jobs)
+            queue.monitor(submitted_jobs, self.sentinels)
 
     def __cluster(self, command: list):
         """
         Method to submit jobs to cluster
         """
-        return cluster_submission(
+        log_name = f"nfact_pp_{os.path.basename(os.path.dirname(command[2]))}"
+        sentinel = self.__sentinel(command)
+        job_id = cluster_submission(
             command,
             self.cluster_time,
             self.cluster_ram,
             self.cluster_queue,
-            f"nfact_pp_{os.path.basename(os.path.dirname(command[2]))}",
+            log_name,
             os.path.join(self.__nfact_dir(command), "logs"),
             self.cluster_qos,
             self.gpu,
+            sentinel,
         )
+        self.sentinels[job_id] = sentinel
+        return job_id
 
     def __check_number_of_cores(self):
         """
@@ -535,31 +545,100 @@ class Probtrackx:
     def __parallel_mode(self) -> None:
         """
         Method to parallell process
-        multiple subjects
+        multiple subjects.
+
+        Up to self.parallel subjects are
+        run at once and the next subject is
+        started as soon as any finishes.
         """
         self.__check_number_of_cores()
         print(
             f"{self.col['pink']}Parallel processing with {self.parallel} cores{self.col['reset']}"
         )
-        pool = multiprocessing.Pool(processes=self.parallel)
+        pending = iter(self.command)
+        finished = []
 
-        def kill_pool(sig, frame):
+        def kill_processes(sig, frame):
             """
-            Method to kill pool safely.
-            Also prints kill message so that
-            the singit doesn't print it 100x
-            times
+            Method to kill running processes
+            safely. Also prints kill message
+            once.
             """
-
-            pool.terminate()
+            for process in list(self.processes.values()):
+                process.terminate()
             print(
                 f"\n{self.col['darker_pink']}Recieved kill signal (Ctrl+C). Terminating..."
             )
             print(f"Exiting...{self.col['reset']}\n")
             exit(0)
 
-        signal.signal(signal.SIGINT, kill_pool)
-        pool.map(self._run_probtrackx, self.command)
+        signal.signal(signal.SIGINT, kill_processes)
+        with ThreadPoolExecutor(self.parallel) as executor:
+            running = {
+                executor.submit(self.__launch, command)
+                for command in islice(pending, self.parallel)
+            }
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for job in done:
+                    job = job.result()
+                    print(
+                        f"{self.col['pink']}Finished:{self.col['reset']} {job['subject']} "
+                        f"in {job['wall_time']} (exit code {job['exit_code']})"
+                    )
+                    finished.append(job)
+                running |= {
+                    executor.submit(self.__launch, command)
+                    for command in islice(pending, len(done))
+                }
+        failed = [job["subject"] for job in finished if job["exit_code"] != 0]
+        if failed:
+            error_and_exit(
+                False,
+                f"Error in probtrackx for {' '.join(failed)} please check log files",
+            )
+
+    def __launch(self, command: list) -> dict:
+        """
+        Method to run probtrackx for
+        a subject and wait for it to
+        finish.
+
+        Parameters
+        ----------
+        command: list
+            command in list form to run
+
+        Returns
+        -------
+        dict: dictionary
+            subject, exit code
+            and wall time
+        """
+        nfactpp_directory = self.__nfact_dir(command)
+        subject = self.__subject_id(nfactpp_directory)
+        print("Running", os.path.basename(command[0]), f"on subject {subject}")
+        timer = Timer()
+        timer.tic()
+        with open(self.__log_path(nfactpp_directory), "w") as log_file:
+            try:
+                process = subprocess.Popen(
+                    command,
+                    stdout=log_file,
+                    stderr=log_file,
+                    universal_newlines=True,
+                )
+            except Exception as e:
+                error_and_exit(False, f"The following error occured: {e}")
+            self.processes[subject] = process
+            exit_code = process.wait()
+        self.processes.pop(subject, None)
+        write_sentinel(self.__sentinel(command), exit_code)
+        return {
+            "subject": subject,
+            "exit_code": exit_code,
+            "wall_time": timer.how_long(),
+        }
 
     def __log_name(self):
         return "PP_log_" + get_current_date()
@@ -573,6 +652,17 @@ class Probtrackx:
     def __subject_id(self, nfactpp_directory: str):
         return os.path.basename(nfactpp_directory)
 
+    def __sentinel(self, command: list) -> str:
+        """
+        Method to get the file a subject's
+        probtrackx2 exit code is written to.
+        """
+        nfactpp_directory = self.__nfact_dir(command)
+        return sentinel_path(
+            os.path.join(nfactpp_directory, "logs"),
+            f"nfact_pp_{self.__subject_id(nfactpp_directory)}",
+        )
+
     def _run_probtrackx(self, command: list) -> None:
         """
         Method to run probtrackx
@@ -603,5 +693,6 @@ class Probtrackx:
             run.kill()
         except Exception as e:
             error_and_exit(False, f"The following error occured: {e}")
+        write_sentinel(self.__sentinel(command), run.returncode)
         if run.returncode != 0:
             error_and_exit(False, f"Error in {command[0]} please check log files")
@@ -259,7 +259,7 @@ def get_images(nfact_directory: str, dim: str, algo: str) -> dict:
     return {
         "grey_images": glob(
             os.path.join(
-                nfact_directory, "components", algo, "decomp", f"G_{algo}_dim{dim}*"
+                nfact_directory, "components", algo, "decomp", f"G_{algo}_dim{dim}_*"
             )
         ),
         "white_image": glob(
@@ -1,18 +1,57 @@
-from NFACT.decomp.decomposition.matrix_handling import avg_fdt
+from NFACT.decomp.decomposition.matrix_handling import (
+    avg_fdt,
+    save_avg_matrix,
+    load_previous_matrix,
+    svd_factors,
+    nndsvd,
+)
 from NFACT.decomp.decomposition.decomp import (
     melodic_incremental_group_pca,
     ica_decomp,
     get_parameters,
     nmf_decomp,
     sign_flip,
+    pca_reduction,
+    svd_reduction,
+    white_matter_projection,
+    dimension_sweep,
+    matrix_decomposition,
 )
+from NFACT.decomp.decomposition.matrix_handling import subject_migp
 from NFACT.decomp.pipes.image_handling import create_wta_map
-from NFACT.base.matrix_handling import normalise_components, load_fdt_matrix
-from NFACT.dual_reg.dual_regression import nmf_dual_regression, ica_dual_regression
+from NFACT.base.matrix_handling import (
+    normalise_components,
+    load_fdt_matrix,
+    evict_matrix_cache,
+)
+from NFACT.dual_reg.dual_regression import (
+    nmf_dual_regression,
+    ica_dual_regression,
+    dr_model,
+    save_dr_model,
+    load_dr_model,
+)
+from NFACT.dual_reg.nfact_dr_functions import vol2mat, component_dim
+from NFACT.dual_reg.local import local_run
+from NFACT.base.imagehandling import save_white_matter
+from NFACT.base.cluster_support import (
+    Queue_Monitoring,
+    sentinel_command,
+    read_sentinel,
+)
+from NFACT.pipeline.nfact_pipeline_functions import run_stage
+from NFACT.preprocess.nfactpp_functions import subject_completed, fdt_matrix_complete
+from NFACT.preprocess.nfactpp import remaining_subjects
+from NFACT.base.utils import colours
+import nibabel as nb
+import time
+import shlex
+import subprocess
 import pytest
 import os
 from pathlib import Path
 import numpy as np
+import scipy.sparse as sps
 
 
 @pytest.fixture
@@ -37,6 +76,21 @@ def individual_matrix(fdt_files):
 
 def test_loading_works(individual_matrix):
     assert isinstance(individual_matrix, np.ndarray)
+    assert individual_matrix.dtype == np.float64
+
+
+def test_matrix_cache(fdt_files, individual_matrix, tmp_path):
+    load_fdt_matrix(fdt_files[0], cache_dir=tmp_path)
+    assert len(os.listdir(tmp_path)) == 1
+    cached_matrix = load_fdt_matrix(fdt_files[0], cache_dir=tmp_path)
+    assert np.array_equal(cached_matrix, individual_matrix)
+    for tmp_name in ["in_progress.tmp", "orphan.tmp"]:
+        with open(os.path.join(tmp_path, tmp_name), "w") as tmp_file:
+            tmp_file.write("partial")
+    two_days_ago = time.time() - 2 * 86400
+    os.utime(os.path.join(tmp_path, "orphan.tmp"), (two_days_ago, two_days_ago))
+    evict_matrix_cache(tmp_path, 0)
+    assert os.listdir(tmp_path) == ["in_progress.tmp"]
 
 
 @pytest.fixture
@@ -48,6 +102,120 @@ def test_load_worked(test_matrix):
     assert isinstance(test_matrix, np.ndarray)
 
 
+def test_parallel_average(fdt_files, test_matrix):
+    parallel_matrix = avg_fdt(fdt_files, n_cores=2)
+    assert np.allclose(parallel_matrix, test_matrix)
+    assert parallel_matrix.dtype == np.float64
+    tree_matrix = avg_fdt(fdt_files, n_cores=2, subjects_per_worker=2)
+    assert np.allclose(tree_matrix, test_matrix)
+
+
+def test_memory_mapped_pca(test_matrix, tmp_path):
+    save_avg_matrix(test_matrix, tmp_path)
+    mapped_matrix = load_previous_matrix(os.path.join(tmp_path, "average_matrix2.npy"))
+    assert isinstance(mapped_matrix, np.memmap)
+    assert pca_reduction(10, mapped_matrix).shape == (test_matrix.shape[0], 10)
+    incremental_matrix = pca_reduction(10, mapped_matrix, incremental=True)
+    assert incremental_matrix.shape == (test_matrix.shape[0], 10)
+
+
+def test_svd_reduction_engines(test_matrix):
+    pca_matrix = pca_reduction(10, test_matrix)
+    for pca_type in ["randomized", "arpack", "lobpcg"]:
+        svd_matrix = svd_reduction(10, test_matrix, pca_type)
+        assert abs(np.corrcoef(svd_matrix[:, 0], pca_matrix[:, 0])[0, 1]) > 0.99
+    assert svd_reduction(10, test_matrix, "truncated").shape == pca_matrix.shape
+    # lobpcg does not converge on the test matrix so falls back to arpack
+    assert np.allclose(
+        np.linalg.norm(svd_reduction(10, test_matrix, "lobpcg"), axis=0),
+        np.linalg.norm(svd_reduction(10, test_matrix, "arpack"), axis=0),
+    )
+
+
+def test_dimension_sweep(test_matrix, test_ICA_hyperparameters, tmp_path):
+    save_avg_matrix(test_matrix, tmp_path)
+    mapped_matrix = load_previous_matrix(os.path.join(tmp_path, "average_matrix2.npy"))
+    decomposition_args = {
+        "algo": "ica",
+        "normalise": False,
+        "signflip": True,
+        "pca_dim": 20,
+        "pca_type": "pca",
+        "oversampling": 10,
+        "power_iterations": 4,
+        "cache_dir": None,
+    }
+    for n_cores in [False, 2]:
+        sweep = dict(
+            dimension_sweep(
+                mapped_matrix,
+                [5, 10],
+                test_ICA_hyperparameters,
+                decomposition_args,
+                n_cores,
+            )
+        )
+        assert sorted(sweep) == [5, 10]
+        for dim, components in sweep.items():
+            assert components["grey_components"].shape == (test_matrix.shape[0], dim)
+            assert components["white_components"].shape == (dim, test_matrix.shape[1])
+
+
+def test_nmf_sweep_default_init(
+    test_NMF_hyperparameters, test_matrix, test_nmf, tmp_path
+):
+    cache = os.path.join(tmp_path, "average_matrix2_svd.npz")
+    decomposition_args = {
+        "algo": "nmf",
+        "normalise": False,
+        "signflip": False,
+        "pca_dim": None,
+        "pca_type": None,
+        "oversampling": 10,
+        "power_iterations": 4,
+        "cache_dir": None,
+    }
+    sweep = dict(
+        dimension_sweep(
+            test_matrix,
+            [10],
+            test_NMF_hyperparameters,
+            decomposition_args,
+            svd_cache=cache,
+        )
+    )
+    # Without --warm_start the nndsvd init is left to sckit learn
+    assert not os.path.exists(cache)
+    assert np.allclose(sweep[10]["white_components"], test_nmf["white_components"])
+
+
+@pytest.fixture
+def sparse_matrix(fdt_files):
+    return avg_fdt(fdt_files, sparse=True)
+
+
+def test_sparse_load_worked(sparse_matrix, test_matrix):
+    assert sps.issparse(sparse_matrix)
+    assert np.allclose(sparse_matrix.toarray(), test_matrix)
+
+
+def test_sparse_ica_worked(sparse_matrix, test_ICA_hyperparameters):
+    pca_matrix = melodic_incremental_group_pca(sparse_matrix, 10, 10)
+    components = ica_decomp(test_ICA_hyperparameters, pca_matrix, sparse_matrix)
+    assert components["white_components"].shape == (10, sparse_matrix.shape[1])
+
+
+def test_subject_migp(fdt_files, test_matrix, test_ICA_hyperparameters):
+    pca_matrix = subject_migp(fdt_files, 10, 10)
+    assert pca_matrix.shape == (test_matrix.shape[0], 10)
+    components = ica_decomp(test_ICA_hyperparameters, pca_matrix, fdt_files)
+    assert np.allclose(
+        components["white_components"],
+        white_matter_projection(components["grey_components"], test_matrix),
+        atol=1e-4,
+    )
+
+
 @pytest.fixture
 def test_pca(test_matrix):
     return melodic_incremental_group_pca(test_matrix, 10, 10)
@@ -96,6 +264,45 @@ def test_nmf_worked(test_nmf):
     assert isinstance(test_nmf["white_components"], np.ndarray)
 
 
+def test_online_nmf(test_NMF_hyperparameters, test_matrix, tmp_path):
+    save_avg_matrix(test_matrix, tmp_path)
+    mapped_matrix = load_previous_matrix(os.path.join(tmp_path, "average_matrix2.npy"))
+    parameters = {
+        **test_NMF_hyperparameters,
+        "engine": "online",
+        "batch_size": 16,
+        "validation_fraction": 0.2,
+        "init": "random",
+        "max_epochs": 20,
+    }
+    components = nmf_decomp(parameters, mapped_matrix)
+    assert components["grey_components"].shape == (test_matrix.shape[0], 10)
+    assert components["white_components"].shape == (10, test_matrix.shape[1])
+    assert (components["white_components"] >= 0).all()
+
+
+def test_nmf_warm_start(test_nmf, test_NMF_hyperparameters, test_matrix, tmp_path):
+    cache = os.path.join(tmp_path, "average_matrix2_svd.npz")
+    svd = svd_factors(test_matrix, 15, cache)
+    assert os.path.exists(cache)
+    grey_init, white_init = nndsvd(*svd_factors(test_matrix, 10, cache), 10)
+    assert np.allclose(grey_init, nndsvd(*svd, 10)[0])
+    assert (grey_init >= 0).all() and (white_init >= 0).all()
+    components = matrix_decomposition(
+        test_matrix,
+        "nmf",
+        False,
+        False,
+        0,
+        {**test_NMF_hyperparameters, "n_components": 15},
+        "pca",
+        init_components=test_nmf,
+        svd=svd,
+    )
+    assert components["grey_components"].shape == (test_matrix.shape[0], 15)
+    assert components["white_components"].shape == (15, test_matrix.shape[1])
+
+
 def test_normalise_comp(test_ica):
     norm_comp = normalise_components(
         test_ica["grey_components"], test_ica["white_components"]
@@ -108,6 +315,15 @@ def test_signflip(test_ica):
     assert isinstance(sign_flip(test_ica["white_components"]), np.ndarray)
 
 
+def test_signflip_chunks(test_ica):
+    matrix = np.array([[-5.0, 1.0, 1.0], [5.0, -1.0, -1.0], [0.0, 0.0, 0.0]])
+    assert np.array_equal(sign_flip(matrix), np.abs(matrix) * [[1, -1, -1]])
+    assert np.array_equal(
+        sign_flip(test_ica["white_components"], chunk_size=3),
+        sign_flip(test_ica["white_components"]),
+    )
+
+
 def test_wta(test_ica):
     assert isinstance(create_wta_map(test_ica["white_components"], 0, 0.0), np.ndarray)
 
@@ -122,6 +338,203 @@ def test_nnls_parrallel(test_nmf, individual_matrix):
     assert isinstance(sub_specific["white_components"], np.ndarray)
 
 
+@pytest.fixture
+def exact_nnls(test_nmf, individual_matrix):
+    return nmf_dual_regression(test_nmf, individual_matrix, n_jobs=1)
+
+
+def test_nnls_parrallel_matches(test_nmf, individual_matrix, exact_nnls):
+    sub_specific = nmf_dual_regression(test_nmf, individual_matrix, n_jobs=2)
+    for comp in ["grey_components", "white_components"]:
+        assert np.allclose(sub_specific[comp], exact_nnls[comp])
+
+
+def test_nnls_batched(test_nmf, individual_matrix, exact_nnls):
+    sub_specific = nmf_dual_regression(test_nmf, individual_matrix, tol=1e-8)
+    for comp in ["grey_components", "white_components"]:
+        assert sub_specific[comp].min() >= 0
+        assert np.allclose(sub_specific[comp], exact_nnls[comp], rtol=1e-3, atol=1e-3)
+
+
 def test_ica_dr(test_ica, individual_matrix):
     sub_specific = ica_dual_regression(test_ica, individual_matrix)
     assert isinstance(sub_specific["white_components"], np.ndarray)
+    grey_map = np.linalg.pinv(test_ica["white_components"].T) @ individual_matrix.T
+    white_map = np.linalg.pinv(grey_map.T) @ individual_matrix
+    assert np.allclose(
+        sub_specific["white_components"], white_map, rtol=1e-3, atol=1e-3
+    )
+
+
+def test_dr_loading_overlaps_regression(monkeypatch):
+    timings = {}
+
+    def load_matrix(subject):
+        start = time.monotonic()
+        time.sleep(0.2)
+        timings[f"load_{subject}"] = (start, time.monotonic())
+        return subject
+
+    def regression(decomp, component, matrix, parallel):
+        start = time.monotonic()
+        time.sleep(0.2)
+        timings[f"regress_{matrix}"] = (start, time.monotonic())
+        return {}
+
+    monkeypatch.setattr(local_run, "run_decomp", regression)
+    dual_reg = local_run.Dual_regression(
+        "nmf", False, False, ["sub-1", "sub-2", "sub-3"], {}, [], "", []
+    )
+    monkeypatch.setattr(dual_reg, "_Dual_regression__connecitivity_matrix", load_matrix)
+    monkeypatch.setattr(
+        dual_reg, "_Dual_regression__save_image", lambda *save_args: None
+    )
+    dual_reg.run()
+    assert len(timings) == 6
+    for subject, next_subject in [("sub-1", "sub-2"), ("sub-2", "sub-3")]:
+        assert timings[f"load_{next_subject}"][0] < timings[f"regress_{subject}"][1]
+
+
+def test_dr_model(test_ica, individual_matrix, tmp_path):
+    model_path = os.path.join(tmp_path, "dr_model.pkl")
+    save_dr_model(dr_model(test_ica), model_path)
+    model = load_dr_model(model_path)
+    assert isinstance(model["white_components"], np.memmap)
+    with_model = ica_dual_regression(model, individual_matrix)
+    without_model = ica_dual_regression(test_ica, individual_matrix)
+    for comp in ["grey_components", "white_components"]:
+        assert np.allclose(with_model[comp], without_model[comp])
+
+
+def test_white_matter_volume_round_trip(test_nmf, tmp_path):
+    white_matter = test_nmf["white_components"]
+    lut_vol = np.zeros(2 * white_matter.shape[1], dtype=np.int32)
+    lut_vol[::2] = np.arange(white_matter.shape[1], 0, -1)
+    lut_path = os.path.join(tmp_path, "lookup_tractspace_fdt_matrix2.nii.gz")
+    nb.Nifti1Image(lut_vol.reshape(2, -1, 1), np.eye(4)).to_filename(lut_path)
+    save_white_matter(white_matter, lut_path, os.path.join(tmp_path, "W_dim10"))
+    white_matter_vol = nb.load(os.path.join(tmp_path, "W_dim10.nii.gz"))
+    assert white_matter_vol.get_data_dtype() == np.float32
+    assert np.allclose(
+        vol2mat(white_matter_vol.get_fdata(), lut_vol.reshape(2, -1, 1)), white_matter
+    )
+
+
+def test_component_dim(tmp_path):
+    for file_name in ["W_NMF_dim10.nii.gz", "W_NMF_dim100.nii.gz"]:
+        Path(tmp_path, file_name).touch()
+    assert component_dim(tmp_path, "10") == 10
+    with pytest.raises(SystemExit):
+        component_dim(tmp_path)
+    os.remove(os.path.join(tmp_path, "W_NMF_dim100.nii.gz"))
+    assert component_dim(tmp_path) == 10
+
+
+def test_queue_monitoring(tmp_path):
+    fake_report = os.path.join(tmp_path, "fsl_sub_report")
+    with open(fake_report, "w") as report:
+        report.write("#!/bin/sh\necho Finished\n")
+    os.chmod(fake_report, 0o755)
+    sentinel = os.path.join(tmp_path, "job.exit")
+    with open(sentinel, "w") as sentinel_file:
+        sentinel_file.write("0\n")
+    queue = Queue_Monitoring(min_wait=0.01, max_wait=0.05, report_command=fake_report)
+    start = time.monotonic()
+    queue.monitor(["1", "2"], {"1": sentinel})
+    assert time.monotonic() - start < 5
+
+
+def test_sentinel_command(tmp_path):
+    log_dir = os.path.join(tmp_path, "log dir")
+    os.makedirs(log_dir)
+    sentinel = os.path.join(log_dir, "job name.exit")
+    command = sentinel_command(["sh", "-c", "exit 3", "arg with spaces"], sentinel)
+    # fsl_sub is given the command as one quoted string
+    subprocess.run(shlex.split(shlex.join(command)))
+    assert read_sentinel(sentinel) == "3"
+
+
+def test_run_stage_manifest(tmp_path):
+    stage_input = os.path.join(tmp_path, "input.txt")
+    outputs = os.path.join(tmp_path, "outputs")
+    manifest = os.path.join(tmp_path, "nfact_manifest.json")
+    with open(stage_input, "w") as input_file:
+        input_file.write("sub-01\n")
+
+    def stage_function(stage_args):
+        os.makedirs(outputs, exist_ok=True)
+        with open(os.path.join(outputs, "result.txt"), "w") as result:
+            result.write(str(stage_args["dim"]))
+
+    assert run_stage(
+        "stage", stage_function, {"dim": 10}, [stage_input], outputs, manifest
+    )
+    assert not run_stage(
+        "stage", stage_function, {"dim": 10}, [stage_input], outputs, manifest
+    )
+    assert run_stage(
+        "stage", stage_function, {"dim": 20}, [stage_input], outputs, manifest
+    )
+    assert run_stage(
+        "stage", stage_function, {"dim": 20}, [stage_input], outputs, manifest, True
+    )
+
+
+def nfactpp_subject(directory, fdt_matrix_rows, exit_code=None):
+    omatrix = os.path.join(directory, "omatrix2")
+    os.makedirs(omatrix)
+    os.makedirs(os.path.join(directory, "logs"))
+    with open(os.path.join(omatrix, "fdt_matrix2.dot"), "w") as fdt_matrix:
+        fdt_matrix.write(fdt_matrix_rows)
+    for output in ["coords_for_fdt_matrix2", "lookup_tractspace_fdt_matrix2.nii.gz"]:
+        with open(os.path.join(omatrix, output), "w") as output_file:
+            output_file.write("0 0 0\n")
+    if exit_code is not None:
+        with open(
+            os.path.join(
+                directory, "logs", f"nfact_pp_{os.path.basename(directory)}.exit"
+            ),
+            "w",
+        ) as sentinel:
+            sentinel.write(f"{exit_code}\n")
+    return directory
+
+
+def test_subject_completed(tmp_path):
+    assert subject_completed(
+        nfactpp_subject(os.path.join(tmp_path, "sub-01"), "1 1 2\n2 3 4\n", 0)
+    )
+    # Ran before exit codes were written
+    assert subject_completed(
+        nfactpp_subject(os.path.join(tmp_path, "sub-02"), "1 1 2\n2 3 4\n")
+    )
+    assert not subject_completed(
+        nfactpp_subject(os.path.join(tmp_path, "sub-03"), "1 1 2\n2 3", 0)
+    )
+    assert not subject_completed(
+        nfactpp_subject(os.path.join(tmp_path, "sub-04"), "1 1 2\n2 3 4\n", 1)
+    )
+    assert not subject_completed(os.path.join(tmp_path, "sub-05"))
+
+
+def test_remaining_subjects(tmp_path):
+    nfactpp_directory = os.path.join(tmp_path, "nfact_pp")
+    nfactpp_subject(os.path.join(nfactpp_directory, "sub-01"), "1 1 2\n2 3 4\n")
+    nfactpp_subject(os.path.join(nfactpp_directory, "sub-02"), "1 1 2\n2 3 4\n", 1)
+    subjects = [os.path.join(tmp_path, "study", sub) for sub in ["sub-01", "sub-02"]]
+    arg = {"list_of_subjects": subjects, "outdir": str(tmp_path)}
+    assert remaining_subjects(arg, colours()) == subjects[1:]
+    assert arg["list_of_subjects"] == subjects
+
+
+def test_fdt_matrix_complete(tmp_path):
+    fdt_matrix = os.path.join(tmp_path, "fdt_matrix2.dot")
+    for rows, complete in [
+        ("1 1 2\n2 3 4\n", True),
+        ("1 1 2\n2 3 4", False),
+        ("1 1 2\n2 3\n", False),
+        ("", False),
+    ]:
+        with open(fdt_matrix, "w") as matrix_file:
+            matrix_file.write(rows)
+        assert fdt_matrix_complete(fdt_matrix) == complete